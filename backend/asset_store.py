@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no build lock, concurrent builders race on the final rename
+    fcntl = None
+
+MANIFEST_VERSION = 1
+ARRAY_FIELDS = ("img", "lm", "tri", "thumb")
+
+Categories = Dict[str, List[Dict[str, Any]]]
+
+
+def source_hash(assets_dir: str, code_files: List[str]) -> str:
+    """Hash of every asset file's path, size and mtime plus the preprocessing code."""
+    h = hashlib.sha1(f"v{MANIFEST_VERSION}".encode())
+    for dirpath, dirnames, filenames in os.walk(assets_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            h.update(f"{os.path.relpath(path, assets_dir)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    for path in code_files:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class AssetStore:
+    """
+    Preprocessed assets shared by every server worker process.
+
+    The first process to start runs the normal asset loading and writes each
+    asset's arrays (img, lm, tri, thumb) as .npy files plus a manifest.json
+    with the remaining fields, into <root>/<source hash>/. Every process then
+    memory-maps the arrays read-only, so the pages live once in the OS page
+    cache however many workers attach, and a worker start-up is a JSON read.
+    A change to the assets or the preprocessing code gives a new hash and a
+    rebuild.
+    """
+
+    def __init__(self, root: str, assets_dir: str, code_files: Optional[List[str]] = None):
+        self.root = root
+        self.assets_dir = assets_dir
+        self.code_files = code_files or []
+
+    def load_or_build(self, build: Callable[[], Categories]) -> Tuple[Categories, bool]:
+        """Attach to the store for the current sources, building it with build() if needed; returns (categories, built)."""
+        digest = source_hash(self.assets_dir, self.code_files)
+        store_dir = os.path.join(self.root, digest[:16])
+        categories = self.load(store_dir)
+        if categories is not None:
+            return categories, False
+
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)  # other workers wait here for the builder
+            categories = self.load(store_dir)
+            if categories is not None:
+                return categories, False
+            t0 = time.time()
+            self.write(store_dir, build(), digest)
+            self._prune(keep=os.path.basename(store_dir))
+            print(f"Asset store written to {store_dir} in {time.time() - t0:.1f}s")
+        # Serve from the store too, so the builder shares pages with the other workers
+        return self.load(store_dir), True
+
+    def write(self, store_dir: str, categories: Categories, digest: str):
+        """Write to a temporary directory, then rename it into place in one step."""
+        tmp_dir = f"{store_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        manifest_categories = []
+        n = 0
+        for folder, assets in categories.items():
+            entries = []
+            for asset in assets:
+                entry = {k: v for k, v in asset.items() if k not in ARRAY_FIELDS}
+                entry["arrays"] = {}
+                for field in ARRAY_FIELDS:
+                    if asset.get(field) is None:
+                        continue
+                    name = f"{n:04d}_{field}.npy"
+                    np.save(os.path.join(tmp_dir, name), np.ascontiguousarray(np.asarray(asset[field])))
+                    entry["arrays"][field] = name
+                entries.append(entry)
+                n += 1
+            manifest_categories.append([folder, entries])
+
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "source_hash": digest,
+            "assets": n,
+            "categories": manifest_categories,
+        }
+        with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        try:
+            os.replace(tmp_dir, store_dir)
+        except OSError:
+            # Another builder finished first; its store has the same content
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def load(self, store_dir: str) -> Optional[Categories]:
+        """Categories with memory-mapped, read-only arrays, or None if the store is missing or incomplete."""
+        manifest_path = os.path.join(store_dir, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("version") != MANIFEST_VERSION:
+                return None
+            categories: Categories = {}
+            for folder, entries in manifest["categories"]:
+                categories[folder] = []
+                for entry in entries:
+                    asset = {k: v for k, v in entry.items() if k != "arrays"}
+                    for field, name in entry["arrays"].items():
+                        # Plain ndarray view of the mapping: zero-copy, read-only, no memmap overhead per slice
+                        asset[field] = np.asarray(np.load(os.path.join(store_dir, name), mmap_mode="r"))
+                    categories[folder].append(asset)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Asset store {store_dir} unreadable: {e}")
+            return None
+        return categories
+
+    def _prune(self, keep: str):
+        """Remove stores for older sources (workers still mapping them keep their pages on POSIX)."""
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if ".tmp-" in name and fcntl is None:
+                continue  # without the lock this may be another builder's work in progress
+            if name != keep and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
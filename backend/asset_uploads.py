@@ -0,0 +1,142 @@
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+IMAGE_EXTENSIONS = (".png", ".webp", ".jpg", ".jpeg")
+SOUND_EXTENSIONS = (".wav", ".mp3")
+CATEGORY_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+UPLOAD_STEM_PATTERN = re.compile(r"^upload_[0-9a-f]{12}$")
+# Outside the source tree, so uploads survive a checkout and leave UI/assets (and the asset store hash) alone
+DEFAULT_UPLOAD_DIR = os.path.join(os.path.expanduser("~"), ".morphy", "asset_uploads")
+
+
+def is_upload(fpath: str) -> bool:
+    """Whether an asset file was stored by AssetUploadQueue (its name carries the job id)."""
+    return bool(UPLOAD_STEM_PATTERN.match(os.path.splitext(os.path.basename(fpath))[0]))
+
+
+class AssetUploadQueue:
+    """
+    Uploaded assets, preprocessed off the request path.
+
+    submit() only validates the upload and queues a job. A small worker pool,
+    running at a lower OS priority so live frames keep the CPU, writes the
+    files to <upload_dir>/<category>/upload_<job id>.<ext>, builds the asset
+    with process(image path, category) and hands it to register(category,
+    asset). The files stay in upload_dir, which the service loads next to
+    the bundled assets, so the asset comes back (with the same id) after a
+    restart.
+
+    Jobs live in this process only: with several server workers, the upload
+    is registered in the worker that received it and in every worker after
+    a restart.
+    """
+
+    def __init__(self, upload_dir: str,
+                 process: Callable[[str, str], Optional[Dict[str, Any]]],
+                 register: Callable[[str, Dict[str, Any]], None],
+                 workers: int = 1, max_bytes: int = 10 * 1024 * 1024, max_jobs: int = 256, nice: int = 10):
+        self.upload_dir = upload_dir
+        self.process = process
+        self.register = register
+        self.max_bytes = max_bytes
+        self.max_jobs = max_jobs
+        self.nice = nice
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="asset-upload",
+                                        initializer=self._lower_priority)
+
+    def submit(self, category: str, image_name: str, image_bytes: bytes,
+               sound_name: Optional[str] = None, sound_bytes: Optional[bytes] = None) -> Dict[str, Any]:
+        """Queue an upload; returns the job. Raises ValueError for an invalid upload."""
+        if not CATEGORY_PATTERN.match(category or ""):
+            raise ValueError("Category must be 1-64 letters, digits, '_' or '-'")
+        image_ext = os.path.splitext(image_name or "")[1].lower()
+        if image_ext not in IMAGE_EXTENSIONS:
+            raise ValueError(f"Image must be one of {', '.join(IMAGE_EXTENSIONS)}")
+        if not image_bytes:
+            raise ValueError("Empty image")
+        sound_ext = None
+        if sound_bytes:
+            sound_ext = os.path.splitext(sound_name or "")[1].lower()
+            if sound_ext not in SOUND_EXTENSIONS:
+                raise ValueError(f"Sound must be one of {', '.join(SOUND_EXTENSIONS)}")
+
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "category": category,
+            "filename": os.path.basename(image_name),
+            "has_sound": sound_ext is not None,
+            "asset_id": None,
+            "error": None,
+            "submitted": time.time(),
+            "seconds": None,
+        }
+        with self._lock:
+            while len(self.jobs) >= self.max_jobs:
+                self.jobs.popitem(last=False)
+            self.jobs[job_id] = job
+        self._pool.submit(self._run, job, image_ext, image_bytes, sound_ext, sound_bytes)
+        return dict(job)
+
+    def pending(self) -> int:
+        """Jobs queued or being processed."""
+        with self._lock:
+            return sum(1 for job in self.jobs.values() if job["status"] in ("queued", "processing"))
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _run(self, job: Dict[str, Any], image_ext: str, image_bytes: bytes,
+             sound_ext: Optional[str], sound_bytes: Optional[bytes]):
+        self._update(job, status="processing")
+        folder = os.path.join(self.upload_dir, job["category"])
+        base = os.path.join(folder, f"upload_{job['job_id']}")
+        written = []
+        try:
+            os.makedirs(folder, exist_ok=True)
+            # Sound first: the asset loader looks it up next to the image
+            for ext, data in ((sound_ext, sound_bytes), (image_ext, image_bytes)):
+                if ext is None:
+                    continue
+                with open(base + ext, "wb") as f:
+                    f.write(data)
+                written.append(base + ext)
+
+            asset = self.process(base + image_ext, job["category"])
+            if asset is None:
+                raise ValueError("Unreadable image or no face found")
+            self.register(job["category"], asset)
+            outcome = {"status": "done", "asset_id": asset["id"]}
+        except Exception as e:
+            for path in written:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            outcome = {"status": "failed", "error": str(e)}
+            print(f"Asset upload {job['job_id']} failed: {e}")
+        self._update(job, seconds=round(time.time() - job["submitted"], 3), **outcome)
+
+    def _update(self, job: Dict[str, Any], **fields: Any):
+        """Change a job under the lock that status() and pending() read it with."""
+        with self._lock:
+            job.update(fields)
+
+    def _lower_priority(self):
+        """Linux nices individual threads; elsewhere the workers keep the normal priority."""
+        if self.nice and hasattr(os, "setpriority") and hasattr(threading, "get_native_id"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+            except OSError:
+                pass
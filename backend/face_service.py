@@ -3,8 +3,36 @@ import numpy as np
 import os
 import glob
 import base64
+import json
+import time
+import threading
 import mediapipe as mp
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Any
+from recording import RecordingManager
+from gender_cache import GenderCache
+from gender_batcher import GenderBatcher
+from gender_backends import GENDER_BACKENDS, load_gender_backend, default_model_files
+from landmark_fixtures import LandmarkFixture, ReplayFaceMesh
+from metrics import metrics
+from flight_recorder import FlightRecorder
+from asset_store import AssetStore
+from asset_uploads import AssetUploadQueue, DEFAULT_UPLOAD_DIR, is_upload
+from quality import QualityController, QUALITY_TIERS
+
+# Eye corners (outer, inner) used to place the iris points missing from the 468-point mesh
+IRIS_EYE_CORNERS = ((33, 133), (362, 263))
+
+# What an asset needs computed per frame (asset["needs"]). iris: refined 478-point
+# mesh; mesh: "warp" (every landmark, iris padded in if missing) or "anchors" (the
+# few points apply_overlay reads, which every mesh variant has); mouth: open/closed
+# state for the sound; segmentation: clip the filter to the person's silhouette.
+# An optional <image>.json next to the asset overrides iris / mouth / segmentation.
+ASSET_NEEDS_OVERRIDABLE = ("iris", "mouth", "segmentation")
+
+# Categories whose images are placed as rigid overlays instead of warped
+OVERLAY_FOLDERS = ("Male", "Female")
 
 
 class FaceService:
@@ -26,6 +54,8 @@ class FaceService:
         
         # Assets directory path (relative to backend folder)
         self.assets_dir = os.path.join(os.path.dirname(__file__), "..", "UI", "assets")
+        # Assets added through POST /assets, kept out of the source tree and loaded alongside it
+        self.upload_dir = os.environ.get("ASSET_UPLOAD_DIR", DEFAULT_UPLOAD_DIR)
         
         # Initialize MediaPipe Face Mesh
         self.mp_face_mesh = mp.solutions.face_mesh
@@ -39,6 +69,27 @@ class FaceService:
             min_detection_confidence=0.5
         )
 
+        # Multi-face mode (group selfies): cap on faces per frame, mesh created on first use
+        self.max_faces = int(os.environ.get("MAX_FACES", 4))
+        self.multi_face_mesh = None
+        self.light_multi_face_mesh = None
+        self._face_pool = None
+        self.frame_segmenter = None  # per-frame person segmentation, for assets that need it
+
+        # Quality tiers: QUALITY_TARGET_MS (per-frame processing target) enables the controller
+        self.quality = QualityController(target_ms=float(os.environ.get("QUALITY_TARGET_MS", 0)))
+        self.light_face_mesh = None
+        # Last detection per session, for detect_every > 1 (least recently used evicted first)
+        self.tracked_faces: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._tracked_lock = threading.Lock()
+        self._asset_pyramid: Dict[Any, Dict[str, Any]] = {}  # (asset id, asset_level, warp_step) -> asset
+        self._warp_contour_indices = {i for edge in self.mp_face_mesh.FACEMESH_CONTOURS for i in edge}
+
+        # MediaPipe graphs are not thread-safe and reject out-of-order timestamps,
+        # so concurrent requests take turns on each per-frame mesh
+        self._mesh_locks: Dict[int, threading.Lock] = {}
+        self._mesh_locks_guard = threading.Lock()
+
         # Asset loader mesh (higher accuracy)
         self.asset_loader_mesh = self.mp_face_mesh.FaceMesh(
             static_image_mode=True,
@@ -47,56 +98,137 @@ class FaceService:
             min_detection_confidence=0.1
         )
 
+        # Gender mesh (only used when the session has no recent landmarks)
+        self.gender_mesh = self.mp_face_mesh.FaceMesh(
+            static_image_mode=False,
+            max_num_faces=1,
+            refine_landmarks=False,
+            min_detection_confidence=0.5
+        )
+
         self.segmenter = self.mp_selfie_segmentation.SelfieSegmentation(model_selection=1)
 
-        # Initialize face cascade for face detection (used in gender detection)
+        # Last landmarks per session from process_frame, reused by detect_gender
+        self.last_landmarks: Dict[str, Dict[str, Any]] = {}
+        self.landmark_cache_ttl = 1.0  # seconds
+        self.max_cached_sessions = 256
+
+        # Face cascade, fallback face detection for gender when no landmarks are found
         cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
         self.face_cascade = cv2.CascadeClassifier(cascade_path)
 
         # Initialize Gender Detection Model
-        self.gender_model_dir = os.path.join(os.path.dirname(__file__), "..", "task_5_ai_gender")
-        self.gender_proto = os.path.join(self.gender_model_dir, "deploy.prototxt")
-        self.gender_model = os.path.join(self.gender_model_dir, "gender_net.caffemodel")
+        # GENDER_BACKEND selects caffe (default), onnx or tflite; GENDER_MODEL_PATH overrides the model file
+        self.gender_backend_name = os.environ.get("GENDER_BACKEND", "caffe")
+        gender_model_path = os.environ.get("GENDER_MODEL_PATH")
         
-        self.gender_net = None
+        self.gender_backend = None
+        self.gender_batcher = None
         self.gender_list = ['Male', 'Female']
-        self.mean_values = (104, 117, 123)
+        self.gender_input_size = 227
         
-        if os.path.exists(self.gender_proto) and os.path.exists(self.gender_model):
-            try:
-                self.gender_net = cv2.dnn.readNetFromCaffe(self.gender_proto, self.gender_model)
-                print("Gender model loaded successfully")
-            except Exception as e:
-                print(f"Error loading gender model: {e}")
+        if self.gender_backend_name not in GENDER_BACKENDS:
+            print(f"Unknown GENDER_BACKEND '{self.gender_backend_name}', available: {list(GENDER_BACKENDS)}; "
+                  f"gender detection disabled")
         else:
-            print(f"Gender model files not found at {self.gender_model_dir}")
+            model_files = [gender_model_path] if gender_model_path else default_model_files(self.gender_backend_name)
+            if all(os.path.exists(f) for f in model_files):
+                try:
+                    self.gender_backend = load_gender_backend(self.gender_backend_name, gender_model_path)
+                    self.gender_input_size = self.gender_backend.input_size
+                    # Concurrent requests share batched forward passes
+                    self.gender_batcher = GenderBatcher(self.gender_backend)
+                    print(f"Gender model loaded successfully ({self.gender_backend_name})")
+                except Exception as e:
+                    print(f"Error loading gender model: {e}")
+            else:
+                print(f"Gender model files not found: {model_files}")
+
+        # Per-session smoothed gender results; tune refresh_interval etc. here
+        self.gender_cache = GenderCache()
         
-        # Load all assets
+        # Load all assets. With ASSET_STORE_DIR set, the first worker process preprocesses
+        # them into a shared on-disk store and every worker memory-maps it read-only
         self.categories: Dict[str, List[Dict[str, Any]]] = {}
-        self._load_assets()
-        self._load_overlay_assets()
+        self.asset_store: Optional[AssetStore] = None
+        if os.environ.get("ASSET_STORE_DIR"):
+            self.asset_store = AssetStore(os.environ["ASSET_STORE_DIR"], self.assets_dir, code_files=[__file__])
+            self.categories, built = self.asset_store.load_or_build(self._build_categories)
+            if not built:
+                print(f"Attached to asset store with {sum(len(a) for a in self.categories.values())} assets")
+        else:
+            self._build_categories()
+        # Uploads are few and change at runtime: preprocessed on every start, never stored
+        if os.path.isdir(self.upload_dir):
+            self._load_assets(self.upload_dir)
+            self._load_overlay_assets(self.upload_dir)
+        # Swapped, never mutated, once serving: readers iterate without locking
+        self._categories_lock = threading.Lock()
+
+        # POST /assets: preprocessing on background workers, registered when ready
+        self.uploads = AssetUploadQueue(
+            self.upload_dir, self._process_upload, self._register_asset,
+            workers=int(os.environ.get("ASSET_UPLOAD_WORKERS", 1)),
+            max_bytes=int(os.environ.get("ASSET_UPLOAD_MAX_BYTES", 10 * 1024 * 1024))
+        )
         
-        # Audio & Video State
-        self.movie_path = os.path.join(os.path.dirname(__file__), "output.avi")
-        self.out_video = None
-        self.is_recording = False
-        self.recording_frames_count = 0
+        # Video State (one recording per session)
+        self.recordings = RecordingManager()
+
+        # Last frames per session for /admin/flight-recorder; FLIGHT_RECORDER_SLOW_MS enables auto dumps
+        self.flight_recorder = FlightRecorder(
+            capacity=int(os.environ.get("FLIGHT_RECORDER_FRAMES", 120)),
+            slow_ms=float(os.environ.get("FLIGHT_RECORDER_SLOW_MS", 0)),
+            dump_dir=os.environ.get("FLIGHT_RECORDER_DIR"),
+            max_dumps=int(os.environ.get("FLIGHT_RECORDER_MAX_DUMPS", 50))
+        )
+        
+        metrics.add_gauge("morphy_assets_loaded", "Assets loaded across all categories",
+                          lambda: sum(len(assets) for assets in self.categories.values()))
+        metrics.add_gauge("morphy_active_recordings", "Sessions currently recording",
+                          lambda: sum(1 for s in list(self.recordings.sessions.values()) if s.active))
+        metrics.add_gauge("morphy_landmark_sessions", "Sessions with cached landmarks",
+                          lambda: len(self.last_landmarks))
+        metrics.add_gauge("morphy_asset_uploads_pending", "Uploaded assets waiting for preprocessing",
+                          self.uploads.pending)
+
+        # Replay recorded landmarks instead of running FaceMesh on frames (tests/benchmarks)
+        self.replay_fixture: Optional[LandmarkFixture] = None
+        if os.environ.get("LANDMARK_REPLAY"):
+            self.enable_replay(os.environ["LANDMARK_REPLAY"])
         
         print(f"FaceService initialized with {len(self.categories)} categories")
 
+    def enable_replay(self, fixture_path: str):
+        """Substitute a landmark fixture's recorded results for every per-frame FaceMesh."""
+        self.replay_fixture = LandmarkFixture(fixture_path)
+        self.face_mesh = ReplayFaceMesh(self.replay_fixture, max_num_faces=1)
+        self.multi_face_mesh = ReplayFaceMesh(self.replay_fixture, max_num_faces=self.max_faces)
+        self.gender_mesh = ReplayFaceMesh(self.replay_fixture, max_num_faces=1)
+        self.light_face_mesh = ReplayFaceMesh(self.replay_fixture, max_num_faces=1)
+        self.light_multi_face_mesh = ReplayFaceMesh(self.replay_fixture, max_num_faces=self.max_faces)
+        print(f"Replaying landmarks from {fixture_path} ({len(self.replay_fixture)} frames)")
+
+
+    def _build_categories(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Preprocess every asset in the assets directory into self.categories."""
+        self._load_assets(self.assets_dir)
+        self._load_overlay_assets(self.assets_dir)
+        return self.categories
     
-    def _load_assets(self):
-        """Load all assets from the assets directory."""
-        if not os.path.exists(self.assets_dir):
-            print(f"Assets directory not found: {self.assets_dir}")
+    def _load_assets(self, root: str):
+        """Load all assets from an assets directory, adding to the categories already loaded."""
+        if not os.path.exists(root):
+            print(f"Assets directory not found: {root}")
             return
         
-        folders = [f for f in os.listdir(self.assets_dir) 
-                   if os.path.isdir(os.path.join(self.assets_dir, f))]
+        folders = [f for f in os.listdir(root) 
+                   if os.path.isdir(os.path.join(root, f))]
         
         for folder in folders:
-            folder_path = os.path.join(self.assets_dir, folder)
-            self.categories[folder] = []
+            folder_path = os.path.join(root, folder)
+            loaded = self.categories.setdefault(folder, [])
+            count = len(loaded)
             
             extensions = ('*.png', '*.webp', '*.jpg', '*.jpeg', '*.PNG', '*.JPG', '*.JPEG')
             all_files = []
@@ -107,19 +239,18 @@ class FaceService:
             
             for idx, fpath in enumerate(unique_files):
                 try:
-                    asset_data = self._process_asset(fpath, f"{folder}_{idx}")
+                    asset_data = self._process_asset(fpath, self._asset_id(folder, idx, fpath))
                     if asset_data:
-                        self.categories[folder].append(asset_data)
+                        loaded.append(asset_data)
                 except Exception as e:
                     print(f"Error loading asset {fpath}: {e}")
             
-            print(f"Loaded {len(self.categories[folder])} assets from {folder}")
+            print(f"Loaded {len(loaded) - count} assets from {folder_path}")
 
-    def _load_overlay_assets(self):
+    def _load_overlay_assets(self, root: str):
         """Load simple overlay assets (no face detection needed)."""
-        overlay_folders = ['Male', 'Female']
-        for folder in overlay_folders:
-            folder_path = os.path.join(self.assets_dir, folder)
+        for folder in OVERLAY_FOLDERS:
+            folder_path = os.path.join(root, folder)
             if not os.path.isdir(folder_path):
                 continue
             
@@ -135,44 +266,68 @@ class FaceService:
             unique_files = list(set(all_files))
             
             for idx, fpath in enumerate(unique_files):
-                # Skip if already loaded (by _load_assets, though unlikely if they failed face check)
-                existing_ids = [a['id'] for a in self.categories[folder]]
-                asset_id = f"{folder}_{idx}_overlay"
-                
-                # Basic load without mediapipe
-                img = cv2.imread(fpath, cv2.IMREAD_UNCHANGED)
-                if img is None: continue
-                
-                # Ensure RGBA
-                if img.shape[2] == 3:
-                    img = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
-                
-                # Thumbnail
-                h, w = img.shape[:2]
-                scale = 60 / max(h, w)
-                thumb = cv2.resize(img, (int(w*scale), int(h*scale)))
-                
-                # Center on 60x60
-                thumb_final = np.zeros((60, 60, 4), dtype=np.uint8)
-                ty = (60 - thumb.shape[0]) // 2
-                tx = (60 - thumb.shape[1]) // 2
-                thumb_final[ty:ty+thumb.shape[0], tx:tx+thumb.shape[1]] = thumb
-                
-                _, thumb_buffer = cv2.imencode('.png', thumb_final)
-                thumb_b64 = base64.b64encode(thumb_buffer).decode('utf-8')
-
-                asset_data = {
-                    "id": asset_id,
-                    "name": os.path.basename(fpath),
-                    "img": img, # Raw RGBA image
-                    "type": "overlay",
-                    "folder": folder,
-                    "thumbnail": thumb_b64
-                }
-                self.categories[folder].append(asset_data)
-        
-        print(f"Loaded overlay assets for {overlay_folders}")
-    
+                asset_data = self._process_overlay_asset(fpath, f"{self._asset_id(folder, idx, fpath)}_overlay", folder)
+                if asset_data:
+                    self.categories[folder].append(asset_data)
+        
+        print(f"Loaded overlay assets for {list(OVERLAY_FOLDERS)}")
+
+    def _process_overlay_asset(self, fpath: str, asset_id: str, folder: str) -> Optional[Dict]:
+        """Load an overlay image as is (RGBA) with its thumbnail."""
+        img = cv2.imread(fpath, cv2.IMREAD_UNCHANGED)
+        if img is None: return None
+        
+        # Ensure RGBA
+        if img.shape[2] == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+        
+        # Thumbnail
+        h, w = img.shape[:2]
+        scale = 60 / max(h, w)
+        thumb = cv2.resize(img, (int(w*scale), int(h*scale)))
+        
+        # Center on 60x60
+        thumb_final = np.zeros((60, 60, 4), dtype=np.uint8)
+        ty = (60 - thumb.shape[0]) // 2
+        tx = (60 - thumb.shape[1]) // 2
+        thumb_final[ty:ty+thumb.shape[0], tx:tx+thumb.shape[1]] = thumb
+        
+        _, thumb_buffer = cv2.imencode('.png', thumb_final)
+        thumb_b64 = base64.b64encode(thumb_buffer).decode('utf-8')
+
+        return {
+            "id": asset_id,
+            "name": os.path.basename(fpath),
+            "img": img, # Raw RGBA image
+            "type": "overlay",
+            "folder": folder,
+            "thumb": thumb_final,
+            "thumbnail": thumb_b64,
+            "needs": self._asset_needs(fpath, iris=False, mesh="anchors", mouth=False, segmentation=False)
+        }
+
+    @staticmethod
+    def _asset_id(folder: str, idx: int, fpath: str) -> str:
+        """Uploaded files keep the id they were registered with; others are numbered per folder."""
+        if is_upload(fpath):
+            return f"{folder}_{os.path.splitext(os.path.basename(fpath))[0]}"
+        return f"{folder}_{idx}"
+
+    def _process_upload(self, fpath: str, folder: str) -> Optional[Dict]:
+        """Preprocess an uploaded image (upload worker thread)."""
+        asset_id = self._asset_id(folder, 0, fpath)
+        if folder in OVERLAY_FOLDERS:
+            return self._process_overlay_asset(fpath, f"{asset_id}_overlay", folder)
+        return self._process_asset(fpath, asset_id)
+
+    def _register_asset(self, folder: str, asset: Dict[str, Any]):
+        """Add a preprocessed asset to the index without disturbing concurrent readers."""
+        with self._categories_lock:
+            categories = dict(self.categories)
+            categories[folder] = categories.get(folder, []) + [asset]
+            self.categories = categories
+        print(f"Registered asset {asset['id']} in {folder}")
+
     def calculate_delaunay(self, points):
         rect = (0, 0, 4000, 4000)
         subdiv = cv2.Subdiv2D(rect)
@@ -194,39 +349,98 @@ class FaceService:
         ny1, ny2 = max(0, cy-int(hf*(0.5+s))), min(frame_h, cy+int(hf*(0.5+s)))
         return np.array([[nx1,ny1],[cx,ny1],[nx2,ny1],[nx2,cy],[nx2,ny2],[cx,ny2],[nx1,ny2],[nx1,cy]], dtype=np.int32)
     
-    def warp_face_transparent(self, frame, asset, user_lm, opacity=1.0):
-        frame_h, frame_w = frame.shape[:2]
+    def _warp_face_roi(self, asset, user_lm, frame_w, frame_h):
+        """
+        Warp the asset onto one face. Returns (x0, y0, rgba) where rgba covers
+        only the face's region of the frame, starting at (x0, y0).
+        """
         src_img, src_pts, tris = asset["img"], asset["lm"], asset["tri"]
         user_pts = np.vstack((user_lm, self.get_user_boundary_points(user_lm, frame_w, frame_h)))
-        warped_rgba = np.zeros((frame_h, frame_w, 4), dtype=np.uint8)
+
+        # Only the area the triangles can reach needs a buffer
+        x0, y0 = np.maximum(np.min(user_pts, axis=0), 0)
+        x_end, y_end = np.minimum(np.max(user_pts, axis=0) + 1, (frame_w, frame_h))
+        roi_rgba = np.zeros((max(y_end - y0, 0), max(x_end - x0, 0), 4), dtype=np.uint8)
 
         for tri in tris:
             ps = [src_pts[i] for i in tri]
             pt = [user_pts[i] for i in tri]
             r1, r2 = cv2.boundingRect(np.float32(ps)), cv2.boundingRect(np.float32(pt))
             if r1[2]<=0 or r1[3]<=0 or r2[2]<=0 or r2[3]<=0: continue
+            x1, y1, w2, h2 = r2
+            if y1<0 or x1<0 or y1+h2>frame_h or x1+w2>frame_w: continue
             ts = [(p[0]-r1[0], p[1]-r1[1]) for p in ps]
-            tt = [(p[0]-r2[0], p[1]-r2[1]) for p in pt]
-            mask = np.zeros((r2[3], r2[2]), dtype=np.uint8)
+            tt = [(p[0]-x1, p[1]-y1) for p in pt]
+            mask = np.zeros((h2, w2), dtype=np.uint8)
             cv2.fillConvexPoly(mask, np.int32(tt), 255)
             img1 = src_img[r1[1]:r1[1]+r1[3], r1[0]:r1[0]+r1[2]]
             mat = cv2.getAffineTransform(np.float32(ts), np.float32(tt))
-            img2 = cv2.warpAffine(img1, mat, (r2[2], r2[3]), None, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=(0,0,0,0))
-            y1, y2, x1, x2 = r2[1], r2[1]+r2[3], r2[0], r2[0]+r2[2]
-            if y1<0 or x1<0 or y2>frame_h or x2>frame_w: continue
-            target = warped_rgba[y1:y2, x1:x2]
-            target[mask>0] = img2[mask>0]
+            img2 = cv2.warpAffine(img1, mat, (w2, h2), None, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=(0,0,0,0))
+            # copyTo writes through the view and is far cheaper than boolean indexing
+            cv2.copyTo(img2, mask, roi_rgba[y1-y0:y1-y0+h2, x1-x0:x1-x0+w2])
 
+        return int(x0), int(y0), roi_rgba
+
+    def warp_faces_transparent(self, frame, asset, faces_lm, opacity=1.0, timer=None):
+        """
+        Warp the asset onto every face in faces_lm. Faces are warped (in parallel
+        when there are several) into their own regions, pasted in order into one
+        shared RGBA buffer and blended onto the frame in a single pass.
+        An optional StageTimer gets 'warp' and 'blend' laps.
+        """
+        frame_h, frame_w = frame.shape[:2]
+        if len(faces_lm) > 1:
+            pool = self._get_face_pool()
+            rois = list(pool.map(lambda lm: self._warp_face_roi(asset, lm, frame_w, frame_h), faces_lm))
+        else:
+            rois = [self._warp_face_roi(asset, lm, frame_w, frame_h) for lm in faces_lm]
+        rois = [r for r in rois if r[2].size > 0]
+        if timer is not None:
+            timer.lap("warp")
+        if not rois:
+            return frame.copy()
+
+        # Shared compositing buffer covering all faces
+        ux0 = min(x for x, _, _ in rois)
+        uy0 = min(y for _, y, _ in rois)
+        ux1 = max(x + r.shape[1] for x, _, r in rois)
+        uy1 = max(y + r.shape[0] for _, y, r in rois)
+        if len(rois) == 1:
+            warped_rgba = rois[0][2]
+        else:
+            warped_rgba = np.zeros((uy1 - uy0, ux1 - ux0, 4), dtype=np.uint8)
+            for x, y, roi in rois:
+                target = warped_rgba[y-uy0:y-uy0+roi.shape[0], x-ux0:x-ux0+roi.shape[1]]
+                covered = roi[:, :, 3] > 0
+                target[covered] = roi[covered]
+
+        # Pixels outside the faces have zero alpha, so only the union region is blended
+        final_img = frame.copy()
+        region = frame[uy0:uy1, ux0:ux1]
         rgb = warped_rgba[:,:,:3]
         final_alpha = (warped_rgba[:,:,3]/255.0) * opacity 
         a3 = np.dstack([final_alpha]*3)
-        final_img = (rgb.astype(np.float32) * a3 + frame.astype(np.float32) * (1.0 - a3)).astype(np.uint8)
+        final_img[uy0:uy1, ux0:ux1] = (rgb.astype(np.float32) * a3 + region.astype(np.float32) * (1.0 - a3)).astype(np.uint8)
+        if timer is not None:
+            timer.lap("blend")
         return final_img
 
+    def warp_face_transparent(self, frame, asset, user_lm, opacity=1.0):
+        return self.warp_faces_transparent(frame, asset, [user_lm], opacity)
+
+    def _get_face_pool(self):
+        """Persistent worker pool for per-face warps (OpenCV releases the GIL)."""
+        if self._face_pool is None:
+            self._face_pool = ThreadPoolExecutor(max_workers=max(1, min(self.max_faces, os.cpu_count() or 1)),
+                                                 thread_name_prefix="face-warp")
+        return self._face_pool
+
     def _process_asset(self, fpath: str, asset_id: str) -> Optional[Dict]:
         """Process a single asset image and prepare it for warp."""
+        timer = metrics.timer("asset_load")
         img_original = cv2.imread(fpath)
         if img_original is None: return None
+        timer.lap("read")
 
         # Check for sound (metadata only for now)
         base_name = os.path.splitext(fpath)[0]
@@ -237,20 +451,21 @@ class FaceService:
         img_rgb = cv2.cvtColor(img_original, cv2.COLOR_BGR2RGB)
         h, w = img_original.shape[:2]
 
-        res = self.asset_loader_mesh.process(img_rgb)
+        res = self._run_mesh(self.asset_loader_mesh, img_rgb)
         if not res.multi_face_landmarks:
             temp_img = cv2.resize(img_rgb, (w*2, h*2))
-            res = self.asset_loader_mesh.process(temp_img)
+            res = self._run_mesh(self.asset_loader_mesh, temp_img)
             if not res.multi_face_landmarks: return None
             landmarks = np.array([[int(p.x * w), int(p.y * h)] for p in res.multi_face_landmarks[0].landmark], dtype=np.int32)
         else:
             landmarks = np.array([[int(p.x * w), int(p.y * h)] for p in res.multi_face_landmarks[0].landmark], dtype=np.int32)
+        timer.lap("facemesh")
         
         folder_name = os.path.basename(os.path.dirname(fpath))
         
         # 1. Animals Logic
         if folder_name.lower() == 'animals':
-            seg_res = self.segmenter.process(img_rgb)
+            seg_res = self._run_mesh(self.segmenter, img_rgb)
             mask_val = seg_res.segmentation_mask if seg_res.segmentation_mask is not None else np.ones((h, w), dtype=np.float32)
             final_mask = (mask_val > 0.4).astype(np.uint8) * 255
         else:
@@ -272,7 +487,7 @@ class FaceService:
             cv2.fillPoly(face_shape_mask, [poly_points_np], 255)
             
             # Remove background using segmentation
-            seg_res = self.segmenter.process(img_rgb)
+            seg_res = self._run_mesh(self.segmenter, img_rgb)
             mask_val = seg_res.segmentation_mask if seg_res.segmentation_mask is not None else np.ones((h, w), dtype=np.float32)
             seg_mask = (mask_val > 0.4).astype(np.uint8) * 255
             
@@ -289,6 +504,7 @@ class FaceService:
         final_mask = cv2.GaussianBlur(final_mask, (5, 5), 0)
         b, g, r = cv2.split(img_original)
         img_rgba = cv2.merge((b, g, r, final_mask))
+        timer.lap("mask")
         
         # Thumbnail generation
         thumb = cv2.resize(img_rgba, (60, 60))
@@ -306,6 +522,8 @@ class FaceService:
         boundary = np.array([[0,0], [w//2,0], [w-1,0], [w-1,h//2], [w-1,h-1], [w//2,h-1], [0,h-1], [0,h//2]])
         full_lm = np.vstack((landmarks, boundary))
         tri = self.calculate_delaunay(full_lm)
+        timer.lap("triangulation")
+        timer.finish()
         
         return {
             "id": asset_id,
@@ -315,8 +533,22 @@ class FaceService:
             "tri": tri,
             "thumb": thumb_final,
             "sound": sound_path,
-            "thumbnail": thumb_b64
+            "thumbnail": thumb_b64,
+            "needs": self._asset_needs(fpath, iris=True, mesh="warp", mouth=sound_path is not None, segmentation=False)
         }
+
+    @staticmethod
+    def _asset_needs(fpath: str, **needs) -> Dict[str, Any]:
+        """An asset's per-frame requirements: the loader's defaults, overridden by <image>.json if present."""
+        sidecar = os.path.splitext(fpath)[0] + ".json"
+        if os.path.exists(sidecar):
+            try:
+                with open(sidecar) as f:
+                    overrides = json.load(f)
+                needs.update({k: bool(overrides[k]) for k in ASSET_NEEDS_OVERRIDABLE if k in overrides})
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"Ignoring asset settings {sidecar}: {e}")
+        return needs
     
     def get_categories(self) -> List[str]:
         """Get list of available categories."""
@@ -347,132 +579,341 @@ class FaceService:
                     return asset
         return None
     
-    def process_frame(self, frame_b64: str, asset_id: str, opacity: float = 1.0) -> Optional[Dict[str, Any]]:
+    def _run_mesh(self, mesh, rgb_frame):
+        """mesh.process() serialized per mesh instance."""
+        lock = self._mesh_locks.get(id(mesh))
+        if lock is None:
+            with self._mesh_locks_guard:
+                lock = self._mesh_locks.setdefault(id(mesh), threading.Lock())
+        with lock:
+            return mesh.process(rgb_frame)
+
+    def _get_multi_face_mesh(self, refine: bool = True):
+        attr = "multi_face_mesh" if refine else "light_multi_face_mesh"
+        with self._mesh_locks_guard:
+            if getattr(self, attr) is None:
+                setattr(self, attr, self.mp_face_mesh.FaceMesh(
+                    static_image_mode=False,
+                    max_num_faces=self.max_faces,
+                    refine_landmarks=refine,
+                    min_detection_confidence=0.5
+                ))
+        return getattr(self, attr)
+
+    def _get_light_face_mesh(self):
+        """468-point mesh without iris refinement, for assets and quality tiers that skip the iris."""
+        with self._mesh_locks_guard:
+            if self.light_face_mesh is None:
+                self.light_face_mesh = self.mp_face_mesh.FaceMesh(
+                    static_image_mode=False,
+                    max_num_faces=1,
+                    refine_landmarks=False,
+                    min_detection_confidence=0.5
+                )
+        return self.light_face_mesh
+
+    def _person_mask(self, frame) -> np.ndarray:
+        """Boolean person silhouette of a BGR frame (selfie segmentation, created on first use)."""
+        with self._mesh_locks_guard:
+            if self.frame_segmenter is None:
+                self.frame_segmenter = self.mp_selfie_segmentation.SelfieSegmentation(model_selection=0)
+        res = self._run_mesh(self.frame_segmenter, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if res.segmentation_mask is None:
+            return np.ones(frame.shape[:2], dtype=bool)
+        return res.segmentation_mask > 0.4
+
+    def _is_mouth_open(self, raw_landmarks) -> bool:
+        """Mouth open check (same logic as Face.py)."""
+        upper_lip_y = raw_landmarks[13].y
+        lower_lip_y = raw_landmarks[14].y
+        face_height = raw_landmarks[152].y - raw_landmarks[10].y
+        if face_height <= 0:
+            return False
+        ratio = (lower_lip_y - upper_lip_y) / face_height
+        return ratio > 0.02  # تم تصغيرها من 0.05
+
+    def process_frame(self, frame_b64: str, asset_id: str, opacity: float = 1.0,
+                      session_id: str = "default", multi_face: bool = False) -> Optional[Dict[str, Any]]:
         """
         Process a frame with face overlay.
-        Returns dict with 'frame' (base64) and 'mouth_open' (bool).
+        With multi_face, every detected face (up to max_faces) gets the filter.
+        Returns dict with 'frame' (base64), 'mouth_open' (bool), 'faces' (int) and
+        'quality_tier' (the session's tier, see quality.py).
         """
-        mouth_open = False
+        timer = metrics.timer("process_frame")
+        metrics.frames.inc()
         
         # Decode base64 image
         try:
             img_data = base64.b64decode(frame_b64)
+            timer.lap("b64decode")
             nparr = np.frombuffer(img_data, np.uint8)
             frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            timer.lap("imdecode")
         except Exception as e:
-            print(f"Error decoding image: {e}")
+            metrics.dropped_frames.inc()
+            self.flight_recorder.record(session_id, "process_frame", "decode_error", timer.stages,
+                                        asset_id=asset_id, error=str(e))
             return None
         
         if frame is None:
+            metrics.dropped_frames.inc()
+            self.flight_recorder.record(session_id, "process_frame", "decode_error", timer.stages,
+                                        asset_id=asset_id)
             return None
         
         frame_h, frame_w = frame.shape[:2]
-        
-        # Initialize video writer if recording
-        if self.is_recording and self.out_video is None:
-             # Initialize lazily with actual frame size
-             fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-             self.out_video = cv2.VideoWriter(self.movie_path, fourcc, 20.0, (frame_w, frame_h))
-             print(f"Video Writer Initialized: {frame_w}x{frame_h}")
+        tier_index, tier = self.quality.tier_for(session_id)
+        encode_params = [cv2.IMWRITE_JPEG_QUALITY, tier["jpeg_quality"]]
 
         # Get asset
         asset = self.get_asset_by_id(asset_id)
         if asset is None:
             # Just return original frame if no asset
-            _, buffer = cv2.imencode('.jpg', frame)
+            _, buffer = cv2.imencode('.jpg', frame, encode_params)
+            timer.lap("imencode")
             
             # Record original even if no asset
-            if self.is_recording and self.out_video is not None:
-                self.out_video.write(frame)
-                self.recording_frames_count += 1
+            self.recordings.write(session_id, frame)
+            timer.lap("record")
                 
-            return {
+            result = {
                 "frame": base64.b64encode(buffer).decode('utf-8'),
-                "mouth_open": False
+                "mouth_open": False,
+                "faces": 0,
+                "quality_tier": tier["name"]
             }
+            timer.lap("b64encode")
+            self._report_quality(session_id, timer.finish())
+            self.flight_recorder.record(session_id, "process_frame", "no_asset", timer.stages,
+                                        asset_id=asset_id, frame_size=[frame_w, frame_h], quality_tier=tier["name"])
+            return result
             
+        output, faces, mouth_open, landmark_source = self.apply_asset(frame, asset, opacity, session_id,
+                                                                      multi_face, timer, tier)
+        
+        # Write to video if recording
+        self.recordings.write(session_id, output)
+        timer.lap("record")
+
+        # Encode result
+        _, buffer = cv2.imencode('.jpg', output, encode_params)
+        timer.lap("imencode")
+        result = {
+            "frame": base64.b64encode(buffer).decode('utf-8'),
+            "mouth_open": mouth_open,
+            "faces": faces,
+            "quality_tier": tier["name"]
+        }
+        timer.lap("b64encode")
+        self._report_quality(session_id, timer.finish())
+        self.flight_recorder.record(
+            session_id, "process_frame", "ok" if faces else "no_face", timer.stages,
+            asset_id=asset_id, frame_size=[frame_w, frame_h], faces=faces, quality_tier=tier["name"],
+            landmark_source=landmark_source if faces else None
+        )
+        return result
+
+    def apply_asset(self, frame, asset: Dict[str, Any], opacity: float = 1.0, session_id: str = "default",
+                    multi_face: bool = False, timer=None, tier: Optional[Dict[str, Any]] = None):
+        """
+        Apply an asset to a decoded BGR frame (FaceMesh, then warp or overlay).
+        Returns (output frame, number of faces, mouth open, landmark source: see
+        _find_faces). Used by process_frame
+        and in-process by the desktop app. tier is one of quality.QUALITY_TIERS
+        (default: full quality).
+        """
+        tier = tier or QUALITY_TIERS[0]
+        needs = self.asset_needs(asset)
         output = frame.copy()
         
-        # Process with Face Mesh
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        res = self.face_mesh.process(rgb_frame)
+        faces_pts, mouth_open, landmark_source = self._find_faces(frame, session_id, multi_face, tier, needs, timer)
         
-        if res.multi_face_landmarks:
-            raw_landmarks = res.multi_face_landmarks[0].landmark
-            pts = np.array([[int(p.x * frame_w), int(p.y * frame_h)] for p in raw_landmarks], dtype=np.int32)
+        if faces_pts:
+            self._remember_landmarks(session_id, faces_pts[0], frame.shape)
+            if timer is not None:
+                timer.lap("landmarks")
             
             # Check asset type and apply appropriate overlay
             asset_type = asset.get("type", "mask") # Default to mask
+            asset = self._asset_for_tier(asset, tier)
             
             if asset_type == "overlay" or asset_type == "prop":
-                 output = self.apply_overlay(frame, asset, pts, opacity)
+                 for pts in faces_pts:
+                     output = self.apply_overlay(output, asset, pts, opacity)
+                 if timer is not None:
+                     timer.lap("overlay")
             else:
-                 # Default Face Warp
-                 output = self.warp_face_transparent(frame, asset, pts, opacity)
+                 # Default Face Warp, all faces share one blend pass
+                 output = self.warp_faces_transparent(frame, asset, faces_pts, opacity, timer=timer)
+
+            if needs["segmentation"]:
+                np.copyto(output, frame, where=~self._person_mask(frame)[:, :, None])
+                if timer is not None:
+                    timer.lap("segmentation")
             
-            # Detect mouth open (same logic as Face.py)
-            if asset.get("sound"):
-                upper_lip_y = raw_landmarks[13].y
-                lower_lip_y = raw_landmarks[14].y
-                face_height = raw_landmarks[152].y - raw_landmarks[10].y
-                if face_height > 0:
-                    ratio = (lower_lip_y - upper_lip_y) / face_height
-                    is_open = ratio > 0.02  # تم تصغيرها من 0.05
-                    if is_open != mouth_open:
-                        # This avoids spamming logs but shows transition
-                        # Note: we return current state to flutter
-                        mouth_open = is_open
-                        print(f"[DEBUG] Backend Mouth Status: {'OPEN' if mouth_open else 'CLOSED'} (Ratio: {ratio:.4f})")
-        
-        # Write to video if recording
-        if self.is_recording and self.out_video is not None:
-            self.out_video.write(output)
-            self.recording_frames_count += 1
+            # Mouth open on any face triggers the sound
+            mouth_open = mouth_open and bool(asset.get("sound"))
+        else:
+            metrics.no_face_frames.inc()
+        return output, len(faces_pts), mouth_open, landmark_source
 
-        # Encode result
-        _, buffer = cv2.imencode('.jpg', output)
-        return {
-            "frame": base64.b64encode(buffer).decode('utf-8'),
-            "mouth_open": mouth_open
-        }
+    @staticmethod
+    def asset_needs(asset: Dict[str, Any]) -> Dict[str, Any]:
+        """asset["needs"], or what a warp / overlay asset needs when it has none."""
+        needs = asset.get("needs")
+        if needs is not None:
+            return needs
+        if asset.get("type", "mask") in ("overlay", "prop"):
+            return {"iris": False, "mesh": "anchors", "mouth": False, "segmentation": False}
+        return {"iris": True, "mesh": "warp", "mouth": bool(asset.get("sound")), "segmentation": False}
+
+    def _find_faces(self, frame, session_id: str, multi_face: bool, tier: Dict[str, Any],
+                    needs: Dict[str, Any], timer=None):
+        """
+        Face landmarks (pixel coordinates, one array per face), whether any
+        mouth is open and where the landmarks came from: "detected" (FaceMesh),
+        "replay" (a landmark fixture) or "tracked" (the session's last result,
+        reused when the tier detects every N frames). Runs the cheapest FaceMesh
+        variant the asset's needs and the tier allow, at the tier's input width.
+        """
+        frame_h, frame_w = frame.shape[:2]
+        refine = needs["iris"] and tier["refine_landmarks"]
+        variant = (multi_face, refine, needs["mesh"])
+        with self._tracked_lock:
+            tracked = self.tracked_faces.get(session_id)
+            reuse = (tracked is not None and tracked["age"] < tier["detect_every"] - 1
+                     and tracked["shape"] == frame.shape[:2] and tracked["variant"] == variant)
+            if reuse:
+                tracked["age"] += 1
+                self.tracked_faces.move_to_end(session_id)
+        if reuse:
+            if timer is not None:
+                timer.lap("tracked")
+            return tracked["faces"], tracked["mouth_open"], "tracked"
+
+        # Process with Face Mesh (normalized landmarks, so a smaller input maps back directly)
+        small = frame
+        if tier["mesh_width"] and frame_w > tier["mesh_width"]:
+            mesh_w = tier["mesh_width"]
+            small = cv2.resize(frame, (mesh_w, max(1, round(frame_h * mesh_w / frame_w))), interpolation=cv2.INTER_AREA)
+        rgb_frame = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        if multi_face:
+            mesh = self._get_multi_face_mesh(refine)
+        else:
+            mesh = self.face_mesh if refine else self._get_light_face_mesh()
+        res = self._run_mesh(mesh, rgb_frame)
+        faces = res.multi_face_landmarks or []
+        if timer is not None:
+            timer.lap("facemesh")
+
+        faces_raw = [face.landmark for face in faces]
+        faces_pts = [np.array([[int(p.x * frame_w), int(p.y * frame_h)] for p in raw_landmarks], dtype=np.int32)
+                     for raw_landmarks in faces_raw]
+        if needs["mesh"] == "warp":
+            faces_pts = [self._pad_iris(pts) for pts in faces_pts]
+        mouth_open = needs["mouth"] and any(self._is_mouth_open(raw_landmarks) for raw_landmarks in faces_raw)
+
+        with self._tracked_lock:
+            if tier["detect_every"] > 1:
+                if session_id in self.tracked_faces:
+                    self.tracked_faces.move_to_end(session_id)
+                elif len(self.tracked_faces) >= self.max_cached_sessions:
+                    self.tracked_faces.popitem(last=False)
+                self.tracked_faces[session_id] = {"faces": faces_pts, "mouth_open": mouth_open, "age": 0,
+                                                  "shape": frame.shape[:2], "variant": variant}
+            else:
+                self.tracked_faces.pop(session_id, None)
+        return faces_pts, mouth_open, "replay" if self.replay_fixture is not None else "detected"
+
+    @staticmethod
+    def _pad_iris(pts: np.ndarray) -> np.ndarray:
+        """
+        The 468-point mesh (refine_landmarks=False) has no iris points; the warp
+        triangles reference them, so approximate each iris from its eye corners.
+        """
+        if len(pts) != 468:
+            return pts
+        extra = []
+        for corners in IRIS_EYE_CORNERS:
+            eye = pts[list(corners)].astype(np.float32)
+            center = eye.mean(axis=0)
+            r = max(1.0, 0.2 * float(np.linalg.norm(eye[0] - eye[1])))
+            extra.append(center)
+            extra.extend(center + d for d in ((r, 0), (0, -r), (-r, 0), (0, r)))
+        return np.vstack((pts, np.array(extra).astype(np.int32)))
+
+    def _asset_for_tier(self, asset: Dict[str, Any], tier: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The asset as a quality tier uses it, cached per asset and tier: image
+        halved asset_level times (landmarks scaled to match) and, for warp
+        assets, a coarser triangulation when warp_step is not 1.
+        """
+        level, step = tier["asset_level"], tier["warp_step"]
+        if level <= 0 and (step == 1 or asset.get("tri") is None):
+            return asset
+        key = (asset["id"], level, step)
+        scaled = self._asset_pyramid.get(key)
+        if scaled is None:
+            img = asset["img"]
+            for _ in range(level):
+                if min(img.shape[:2]) < 64: break
+                img = cv2.pyrDown(img)
+            scaled = dict(asset, img=img)
+            if asset.get("lm") is not None:
+                h, w = asset["img"].shape[:2]
+                sx, sy = img.shape[1] / w, img.shape[0] / h
+                lm = np.round(asset["lm"] * (sx, sy)).astype(np.int32)
+                scaled["lm"] = lm = np.minimum(lm, (img.shape[1] - 1, img.shape[0] - 1))
+                if step != 1:
+                    # Contours keep the features' shape; the 8 frame boundary points close the mesh
+                    keep = self._warp_contour_indices | set(range(0, 468, step) if step else ()) | set(range(468, len(lm) - 8))
+                    idx = sorted(keep) + list(range(len(lm) - 8, len(lm)))
+                    scaled["tri"] = [[idx[i] for i in t] for t in self.calculate_delaunay(lm[idx])]
+                elif level > 0:
+                    # Rounding can merge points, which Subdiv2D would drop; recompute on the scaled landmarks
+                    scaled["tri"] = self.calculate_delaunay(lm)
+            self._asset_pyramid[key] = scaled
+        return scaled
+
+    def _report_quality(self, session_id: str, total_seconds: float):
+        change = self.quality.report(session_id, total_seconds * 1000.0)
+        if change:
+            metrics.quality_changes.inc(change)
+            print(f"Session {session_id}: quality {change} to '{self.quality.tier_for(session_id)[1]['name']}'")
 
-    def start_recording(self, width: int = 640, height: int = 480, fps: int = 20):
+    def start_recording(self, width: Optional[int] = None, height: Optional[int] = None, fps: int = 20,
+                        session_id: str = "default", codec: Optional[str] = None) -> bool:
         try:
-            # We ignore width/height here and use the first frame's dimension in process_frame
-            self.is_recording = True
-            # Reset writer if it exists
-            if self.out_video:
-                self.out_video.release()
-                self.out_video = None
-            self.recording_frames_count = 0
-            print("Recording mode enabled...")
+            # Without width/height the writer uses the first frame's dimension in process_frame
+            session = self.recordings.start(session_id, width, height, fps, codec)
+            print(f"Recording mode enabled for session {session_id} ({session.codec}, {fps} fps)...")
             return True
         except Exception as e:
             print(f"Error starting recording: {e}")
             return False
 
-    def stop_recording(self) -> Optional[str]:
-        self.is_recording = False
-        if self.out_video:
-            self.out_video.release()
-            self.out_video = None
-            print(f"Recording stopped. Total frames: {self.recording_frames_count}")
-        
-        # If no frames were recorded, return None
-        if self.recording_frames_count == 0:
-            print("No frames recorded.")
+    def stop_recording(self, session_id: str = "default") -> Optional[Dict[str, Any]]:
+        """
+        Stop a session's recording.
+        Returns dict with file info ('path', 'download_token', 'filename', 'codec', 'frames', 'size_bytes',
+        'write_seconds', 'encode_seconds', ...), or None if nothing was recorded.
+        """
+        info = self.recordings.stop(session_id)
+        if info is None:
+            print(f"No frames recorded for session {session_id}.")
             return None
-            
-        # Read file and return base64
-        if os.path.exists(self.movie_path):
-            try:
-                with open(self.movie_path, "rb") as video_file:
-                    b64_video = base64.b64encode(video_file.read()).decode('utf-8')
-                return b64_video
-            except Exception as e:
-                print(f"Error reading video file: {e}")
-                return None
-        return None
+        print(f"Recording stopped for session {session_id}. Total frames: {info['frames']}, "
+              f"{info['codec']}: {info['size_bytes']} bytes, write {info['write_seconds']:.3f}s, "
+              f"encode {info['encode_seconds']:.3f}s")
+        return info
+
+    def get_recording(self, token: str) -> Optional[Dict[str, str]]:
+        """Get the file, media type and download name of the finished recording with this download token."""
+        session = self.recordings.get_finished(token)
+        if session is None:
+            return None
+        return {"path": session.path, "media_type": session.media_type, "filename": session.filename}
 
     def apply_overlay(self, frame, asset, landmarks, opacity=1.0):
         """
@@ -595,62 +1036,149 @@ class FaceService:
         return frame
 
 
-    def detect_gender(self, frame_b64: str) -> Dict[str, Any]:
+    def _remember_landmarks(self, session_id: str, pts: np.ndarray, frame_shape):
+        """Cache a session's latest landmarks so other calls can skip face detection."""
+        now = time.time()
+        if len(self.last_landmarks) >= self.max_cached_sessions and session_id not in self.last_landmarks:
+            for sid, entry in list(self.last_landmarks.items()):
+                if now - entry["time"] > self.landmark_cache_ttl:
+                    self.last_landmarks.pop(sid, None)
+        self.last_landmarks[session_id] = {"pts": pts, "shape": frame_shape[:2], "time": now}
+
+    def _recent_landmarks(self, session_id: str, frame_shape) -> Optional[np.ndarray]:
+        entry = self.last_landmarks.get(session_id)
+        if entry is None or entry["shape"] != frame_shape[:2]:
+            return None
+        if time.time() - entry["time"] > self.landmark_cache_ttl:
+            return None
+        return entry["pts"]
+
+    def _face_box_from_landmarks(self, pts: np.ndarray):
+        """Bounding box (x, y, w, h) of the face landmarks."""
+        x_min, y_min = np.min(pts[:468], axis=0)
+        x_max, y_max = np.max(pts[:468], axis=0)
+        return int(x_min), int(y_min), int(x_max - x_min), int(y_max - y_min)
+
+    def _aligned_face_crop(self, frame, pts: np.ndarray, margin: float = 0.2):
+        """
+        Square face crop rotated so the eye corners are level, resized to the
+        gender net input in a single warpAffine.
+        """
+        size = self.gender_input_size
+        x, y, w, h = self._face_box_from_landmarks(pts)
+        side = max(w, h) * (1.0 + 2 * margin)
+        if side <= 0:
+            return None
+        cx, cy = x + w / 2.0, y + h / 2.0
+
+        left_eye, right_eye = pts[33], pts[263]
+        angle_deg = np.degrees(np.arctan2(right_eye[1] - left_eye[1], right_eye[0] - left_eye[0]))
+
+        M = cv2.getRotationMatrix2D((cx, cy), angle_deg, size / side)
+        M[0, 2] += size / 2.0 - cx
+        M[1, 2] += size / 2.0 - cy
+        return cv2.warpAffine(frame, M, (size, size), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    def _cascade_face_crop(self, frame):
+        """Largest Haar cascade face with padding, or None."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self.face_cascade.detectMultiScale(gray, 1.1, 4, minSize=(50, 50))
+
+        if len(faces) == 0:
+            return None
+
+        # Get the largest face
+        faces = sorted(faces, key=lambda x: x[2] * x[3], reverse=True)
+        x, y, w, h = faces[0]
+
+        # Padding
+        padding = 20
+        face_img = frame[max(0, y-padding):min(frame.shape[0], y+h+padding),
+                         max(0, x-padding):min(frame.shape[1], x+w+padding)]
+        if face_img.size == 0:
+            return None
+        return face_img
+
+    def detect_gender(self, frame_b64: str, session_id: str = "default") -> Dict[str, Any]:
         """
         Detect gender from a base64 encoded frame.
-        
+
+        The face is located from the session's recent FaceMesh landmarks when
+        available, otherwise from a FaceMesh pass, and only as a last resort
+        from the Haar cascade. Predictions are smoothed per session and the
+        network is skipped while the smoothed result is stable.
+
         Args:
             frame_b64: Base64 encoded image
-            
+            session_id: Client session, used to reuse landmarks from process_frame
+
         Returns:
-            Dictionary with gender label and confidence
+            Dictionary with gender label, smoothed confidence, face source and cache state
         """
-        if self.gender_net is None:
+        if self.gender_batcher is None:
             return {"error": "Gender model not initialized"}
 
+        timer = metrics.timer("detect_gender")
         # Decode base64 image
         try:
             img_data = base64.b64decode(frame_b64)
             nparr = np.frombuffer(img_data, np.uint8)
             frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         except Exception as e:
-            print(f"Error decoding image: {e}")
+            self.flight_recorder.record(session_id, "detect_gender", "decode_error", timer.stages, error=str(e))
             return {"error": "Invalid image data"}
         
         if frame is None:
+            self.flight_recorder.record(session_id, "detect_gender", "decode_error", timer.stages)
             return {"error": "Failed to decode image"}
-            
-        # Detect face
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(gray, 1.1, 4, minSize=(50, 50))
-        
-        if len(faces) == 0:
+        timer.lap("decode")
+
+        # Locate face: cached landmarks -> FaceMesh -> cascade
+        source = "cached_landmarks"
+        pts = self._recent_landmarks(session_id, frame.shape)
+        if pts is None:
+            source = "landmarks"
+            frame_h, frame_w = frame.shape[:2]
+            res = self._run_mesh(self.gender_mesh, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if res.multi_face_landmarks:
+                pts = np.array([[int(p.x * frame_w), int(p.y * frame_h)]
+                                for p in res.multi_face_landmarks[0].landmark], dtype=np.int32)
+
+        if pts is not None:
+            face_img = self._aligned_face_crop(frame, pts)
+        else:
+            source = "cascade"
+            face_img = self._cascade_face_crop(frame)
+        timer.lap("face")
+        metrics.gender_requests.inc(source)
+
+        if face_img is None:
+            timer.finish()
+            self.flight_recorder.record(session_id, "detect_gender", "no_face", timer.stages,
+                                        frame_size=[frame.shape[1], frame.shape[0]], landmark_source=source)
             return {"gender": "Unknown", "confidence": 0.0}
-            
-        # Get the largest face
-        faces = sorted(faces, key=lambda x: x[2] * x[3], reverse=True)
-        x, y, w, h = faces[0]
-        
-        # Padding
-        padding = 20
-        face_img = frame[max(0, y-padding):min(frame.shape[0], y+h+padding),
-                         max(0, x-padding):min(frame.shape[1], x+w+padding)]
-                         
-        if face_img.size == 0:
-             return {"gender": "Unknown", "confidence": 0.0}
-             
-        # Prepare input blob for Caffe model
-        blob = cv2.dnn.blobFromImage(face_img, 1.0, (227, 227), self.mean_values, swapRB=False)
-        self.gender_net.setInput(blob)
-        preds = self.gender_net.forward()
-        
-        i = preds[0].argmax()
-        gender = self.gender_list[i]
-        confidence = preds[0][i]
+
+        # Skip the network while the session's smoothed result is stable
+        signature = self.gender_cache.face_signature(face_img)
+        result = self.gender_cache.lookup(session_id, signature)
+        timer.lap("cache")
+
+        if result is None:
+            # Batched with other in-flight requests into one forward pass
+            probs = self.gender_batcher.predict(face_img)
+            result = self.gender_cache.update(session_id, probs, signature)
+            timer.lap("inference")
+        timer.finish()
+        self.flight_recorder.record(session_id, "detect_gender", "ok", timer.stages,
+                                    frame_size=[frame.shape[1], frame.shape[0]], landmark_source=source,
+                                    cached=result["cached"])
         
         return {
-            "gender": gender,
-            "confidence": float(confidence)
+            "gender": self.gender_list[result["index"]],
+            "confidence": result["confidence"],
+            "source": source,
+            "cached": result["cached"],
+            "stable": result["stable"]
         }
 
 
@@ -0,0 +1,116 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+
+class FlightRecorder:
+    """
+    Bounded in-memory history of the last frames of every session.
+
+    Each entry holds one request's stage timings (ms), frame size, asset,
+    landmark source and outcome. Landmark sources: process_frame "detected"
+    (FaceMesh ran on the frame), "replay" (landmark fixture) or "tracked"
+    (the previous detection reused by a quality tier); detect_gender
+    "cached_landmarks", "landmarks" or "cascade". When slow_ms is set, a frame slower than
+    that dumps its session's history to dump_dir as JSON (at most once per
+    dump_interval seconds per session), so the frames leading up to a stall
+    are kept after they leave the ring buffer. Only the newest max_dumps files
+    are kept in dump_dir.
+    """
+
+    def __init__(self, capacity: int = 120, max_sessions: int = 64, slow_ms: float = 0.0,
+                 dump_dir: Optional[str] = None, dump_interval: float = 10.0, max_dumps: int = 50):
+        self.capacity = capacity
+        self.max_sessions = max_sessions
+        self.slow_ms = slow_ms
+        self.dump_dir = dump_dir or os.path.join(tempfile.gettempdir(), "morphy_flight_recorder")
+        self.dump_interval = dump_interval
+        self.max_dumps = max_dumps
+        self._sessions: "OrderedDict[str, deque]" = OrderedDict()
+        self._last_dump: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, session_id: str, op: str, outcome: str, stages: Optional[Dict[str, float]] = None,
+               **fields: Any):
+        """Append one entry; stages are seconds (as in StageTimer.stages) and stored as ms."""
+        entry = {"time": time.time(), "op": op, "outcome": outcome}
+        if stages:
+            entry["stages_ms"] = {k: round(v * 1000.0, 3) for k, v in stages.items()}
+        entry.update(fields)
+
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                if len(self._sessions) >= self.max_sessions:
+                    evicted, _ = self._sessions.popitem(last=False)
+                    self._last_dump.pop(evicted, None)
+                history = self._sessions[session_id] = deque(maxlen=self.capacity)
+            else:
+                self._sessions.move_to_end(session_id)
+            history.append(entry)
+
+        total_ms = entry.get("stages_ms", {}).get("total", 0.0)
+        if self.slow_ms and total_ms > self.slow_ms:
+            self._auto_dump(session_id, total_ms)
+
+    def snapshot(self, session_id: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Entries per session, oldest first (one session, or all of them)."""
+        with self._lock:
+            if session_id is not None:
+                history = self._sessions.get(session_id)
+                return {session_id: list(history)} if history is not None else {}
+            return {sid: list(history) for sid, history in self._sessions.items()}
+
+    def clear(self, session_id: Optional[str] = None):
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(session_id, None)
+
+    def dump(self, session_id: Optional[str] = None, reason: str = "manual") -> str:
+        """Write a snapshot to dump_dir; returns the file path."""
+        os.makedirs(self.dump_dir, exist_ok=True)
+        # Session ids come from clients: keep them short and path-safe
+        safe_sid = re.sub(r'[^A-Za-z0-9_-]', '_', session_id)[:64] if session_id is not None else "all"
+        name = f"flight_{safe_sid}_{time.strftime('%Y%m%d_%H%M%S')}_{int(time.time() * 1000) % 1000:03d}.json"
+        path = os.path.join(self.dump_dir, name)
+        with open(path, "w") as f:
+            json.dump({"reason": reason, "time": time.time(), "sessions": self.snapshot(session_id)}, f, indent=1)
+        self._prune_dumps()
+        return path
+
+    def list_dumps(self) -> List[str]:
+        if not os.path.isdir(self.dump_dir):
+            return []
+        return sorted(f for f in os.listdir(self.dump_dir) if f.endswith(".json"))
+
+    def _prune_dumps(self):
+        """Delete the oldest dumps beyond max_dumps."""
+        if self.max_dumps <= 0:
+            return
+        paths = [os.path.join(self.dump_dir, f) for f in self.list_dumps() if f.startswith("flight_")]
+        try:
+            paths.sort(key=os.path.getmtime)
+        except OSError:
+            return  # Another thread pruned concurrently; the next dump retries
+        for path in paths[:-self.max_dumps]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _auto_dump(self, session_id: str, total_ms: float):
+        now = time.time()
+        with self._lock:
+            if now - self._last_dump.get(session_id, 0.0) < self.dump_interval:
+                return
+            self._last_dump[session_id] = now
+        # Written off the request thread; the snapshot is taken when the thread runs
+        threading.Thread(target=self.dump, args=(session_id, f"slow frame: {total_ms:.1f} ms"),
+                         name="flight-dump", daemon=True).start()
@@ -0,0 +1,171 @@
+import cv2
+import numpy as np
+import os
+from typing import Dict, List, Optional, Tuple, Type
+
+
+# Default model locations (relative to backend folder)
+GENDER_MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "task_5_ai_gender")
+
+
+class GenderBackend:
+    """
+    A gender classifier. predict() takes a batch of BGR face crops and returns
+    an (N, 2) array of [Male, Female] probabilities, one row per crop.
+    """
+
+    name = "base"
+    input_size = 227
+
+    def predict(self, face_imgs: List[np.ndarray]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class CaffeGenderBackend(GenderBackend):
+    """Levi & Hassner AlexNet-style Caffe model (gender_net.caffemodel) via cv2.dnn."""
+
+    name = "caffe"
+    input_size = 227
+    mean_values = (104, 117, 123)
+
+    def __init__(self, model_path: Optional[str] = None, proto_path: Optional[str] = None):
+        self.model_path = model_path or os.path.join(GENDER_MODEL_DIR, "gender_net.caffemodel")
+        self.proto_path = proto_path or os.path.join(GENDER_MODEL_DIR, "deploy.prototxt")
+        self.net = cv2.dnn.readNetFromCaffe(self.proto_path, self.model_path)
+
+    def predict(self, face_imgs: List[np.ndarray]) -> np.ndarray:
+        size = (self.input_size, self.input_size)
+        blob = cv2.dnn.blobFromImages(face_imgs, 1.0, size, self.mean_values, swapRB=False)
+        self.net.setInput(blob)
+        return self.net.forward().reshape(len(face_imgs), 2)
+
+
+def _sigmoid_to_probs(p_female: np.ndarray) -> np.ndarray:
+    p_female = p_female.reshape(-1).astype(np.float32)
+    return np.stack([1.0 - p_female, p_female], axis=1)
+
+
+class OnnxGenderBackend(GenderBackend):
+    """
+    MobileNetV2 from train_gender.py exported to ONNX (see export_gender_model.py),
+    run through cv2.dnn. Expects NCHW RGB input scaled to [0, 1] and a single
+    sigmoid output (1 = Female, as in UTKFace labels).
+    """
+
+    name = "onnx"
+    input_size = 128
+
+    def __init__(self, model_path: Optional[str] = None):
+        self.model_path = model_path or os.path.join(GENDER_MODEL_DIR, "gender_model.onnx")
+        self.net = cv2.dnn.readNetFromONNX(self.model_path)
+
+    def predict(self, face_imgs: List[np.ndarray]) -> np.ndarray:
+        size = (self.input_size, self.input_size)
+        blob = cv2.dnn.blobFromImages(face_imgs, 1.0 / 255.0, size, (0, 0, 0), swapRB=True)
+        self.net.setInput(blob)
+        return _sigmoid_to_probs(self.net.forward())
+
+
+class TFLiteGenderBackend(GenderBackend):
+    """
+    MobileNetV2 from train_gender.py converted to TFLite. Uses tflite_runtime when
+    installed, otherwise tensorflow.lite. Handles float and uint8-quantized models.
+
+    Resizing an interpreter's input reallocates all its tensors, which costs
+    more than a small forward pass, and GenderBatcher sends every batch size
+    from 1 to its max_batch. So batches are zero-padded up to the next size in
+    BATCH_BUCKETS, each bucket keeps its own interpreter allocated once, and
+    larger batches run in chunks of the largest bucket.
+    """
+
+    name = "tflite"
+    input_size = 128
+    BATCH_BUCKETS = (1, 2, 4, 8, 16)
+
+    def __init__(self, model_path: Optional[str] = None, num_threads: Optional[int] = None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self.model_path = model_path or os.path.join(GENDER_MODEL_DIR, "gender_model.tflite")
+        self._make_interpreter = lambda: Interpreter(model_path=self.model_path,
+                                                     num_threads=num_threads or os.cpu_count())
+        interpreter = self._make_interpreter()
+        interpreter.allocate_tensors()
+        self.input_detail = interpreter.get_input_details()[0]
+        self.output_detail = interpreter.get_output_details()[0]
+        self.input_size = int(self.input_detail["shape"][1])
+        # bucket size -> (interpreter, input index, output index)
+        self._interpreters: Dict[int, Tuple[object, int, int]] = {}
+        self._interpreters[int(self.input_detail["shape"][0])] = (
+            interpreter, self.input_detail["index"], self.output_detail["index"])
+
+    def _interpreter_for(self, bucket: int) -> Tuple[object, int, int]:
+        entry = self._interpreters.get(bucket)
+        if entry is None:
+            interpreter = self._make_interpreter()
+            index = interpreter.get_input_details()[0]["index"]
+            interpreter.resize_tensor_input(index, [bucket, self.input_size, self.input_size, 3])
+            interpreter.allocate_tensors()
+            entry = (interpreter, interpreter.get_input_details()[0]["index"],
+                     interpreter.get_output_details()[0]["index"])
+            self._interpreters[bucket] = entry
+        return entry
+
+    def predict(self, face_imgs: List[np.ndarray]) -> np.ndarray:
+        size = (self.input_size, self.input_size)
+        batch = np.stack([cv2.cvtColor(cv2.resize(img, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+                          for img in face_imgs])
+
+        dtype = self.input_detail["dtype"]
+        scale, zero_point = self.input_detail["quantization"]
+        if dtype == np.float32:
+            batch = batch.astype(np.float32) / 255.0
+        elif scale:
+            batch = np.clip(np.round(batch / 255.0 / scale + zero_point), np.iinfo(dtype).min,
+                            np.iinfo(dtype).max).astype(dtype)
+        else:
+            batch = batch.astype(dtype)
+
+        outs = []
+        largest = self.BATCH_BUCKETS[-1]
+        for start in range(0, len(batch), largest):
+            chunk = batch[start:start + largest]
+            n = len(chunk)
+            bucket = next(b for b in self.BATCH_BUCKETS if b >= n)
+            if bucket > n:
+                chunk = np.concatenate([chunk, np.zeros((bucket - n,) + chunk.shape[1:], dtype=chunk.dtype)])
+            interpreter, input_index, output_index = self._interpreter_for(bucket)
+            interpreter.set_tensor(input_index, chunk)
+            interpreter.invoke()
+            outs.append(interpreter.get_tensor(output_index)[:n].astype(np.float32))
+        out = np.concatenate(outs)
+
+        out_scale, out_zero_point = self.output_detail["quantization"]
+        if self.output_detail["dtype"] != np.float32 and out_scale:
+            out = (out - out_zero_point) * out_scale
+        return _sigmoid_to_probs(out)
+
+
+GENDER_BACKENDS: Dict[str, Type[GenderBackend]] = {
+    "caffe": CaffeGenderBackend,
+    "onnx": OnnxGenderBackend,
+    "tflite": TFLiteGenderBackend,
+}
+
+
+def load_gender_backend(name: str = "caffe", model_path: Optional[str] = None) -> GenderBackend:
+    """Create a gender backend by name ("caffe", "onnx" or "tflite")."""
+    if name not in GENDER_BACKENDS:
+        raise ValueError(f"Unknown gender backend '{name}', available: {list(GENDER_BACKENDS)}")
+    return GENDER_BACKENDS[name](model_path)
+
+
+def default_model_files(name: str) -> Tuple[str, ...]:
+    """Files a backend needs when no model path is given."""
+    if name == "caffe":
+        return (os.path.join(GENDER_MODEL_DIR, "deploy.prototxt"),
+                os.path.join(GENDER_MODEL_DIR, "gender_net.caffemodel"))
+    ext = {"onnx": "gender_model.onnx", "tflite": "gender_model.tflite"}[name]
+    return (os.path.join(GENDER_MODEL_DIR, ext),)
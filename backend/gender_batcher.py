@@ -0,0 +1,65 @@
+import numpy as np
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Tuple
+from gender_backends import GenderBackend
+
+
+class GenderBatcher:
+    """
+    Micro-batching scheduler for the gender network.
+
+    Face crops submitted by concurrent callers are collected for up to
+    max_wait_ms and passed to the backend as one batch (a single blob and
+    forward pass); each caller gets its own row back.
+    """
+
+    def __init__(self, backend: GenderBackend, max_batch: int = 16, max_wait_ms: float = 4.0):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[np.ndarray, Future]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="gender-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, face_img: np.ndarray) -> Future:
+        """Queue one BGR face crop; the future resolves to its class probabilities."""
+        future: Future = Future()
+        self._queue.put((face_img, future))
+        return future
+
+    def predict(self, face_img: np.ndarray) -> np.ndarray:
+        return self.submit(face_img).result()
+
+    def predict_many(self, face_imgs: List[np.ndarray]) -> List[np.ndarray]:
+        """Predict several faces (e.g. all faces of one frame), batched with any concurrent callers."""
+        futures = [self.submit(img) for img in face_imgs]
+        return [f.result() for f in futures]
+
+    def _collect(self) -> List[Tuple[np.ndarray, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            crops = [img for img, _ in batch]
+            try:
+                preds = self.backend.predict(crops)
+                for (_, future), row in zip(batch, preds):
+                    future.set_result(row.copy())
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
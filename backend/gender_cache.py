@@ -0,0 +1,111 @@
+import cv2
+import numpy as np
+import threading
+import time
+from typing import Dict, Optional, Any
+
+
+class GenderCacheEntry:
+    """Smoothed gender prediction for one session."""
+
+    def __init__(self, probs: np.ndarray, signature: np.ndarray, now: float):
+        self.ema = probs.astype(np.float32)
+        self.samples = 1
+        self.signature = signature
+        self.last_inference = now
+        self.last_seen = now
+
+
+class GenderCache:
+    """
+    Per-session exponential moving average of gender predictions.
+
+    Once a session's smoothed confidence is stable the cached label is returned
+    without running the network, until refresh_interval seconds have passed or
+    the face no longer looks like the one the estimate was built from.
+    """
+
+    def __init__(self, alpha: float = 0.3, min_samples: int = 3, stable_confidence: float = 0.75,
+                 refresh_interval: float = 10.0, identity_threshold: float = 0.4,
+                 ttl: float = 600.0, max_sessions: int = 256):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.stable_confidence = stable_confidence
+        self.refresh_interval = refresh_interval
+        self.identity_threshold = identity_threshold
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.entries: Dict[str, GenderCacheEntry] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def face_signature(face_img) -> np.ndarray:
+        """Tiny normalized grayscale thumbnail used to notice a different face."""
+        gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY) if face_img.ndim == 3 else face_img
+        small = cv2.resize(gray, (16, 16), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+        small -= small.mean()
+        norm = np.linalg.norm(small)
+        return small / norm if norm > 0 else small
+
+    def _same_face(self, entry: GenderCacheEntry, signature: np.ndarray) -> bool:
+        # 1 - normalized cross-correlation of the two thumbnails
+        distance = 1.0 - float(np.dot(entry.signature, signature))
+        return distance <= self.identity_threshold
+
+    def _is_stable(self, entry: GenderCacheEntry) -> bool:
+        return entry.samples >= self.min_samples and float(entry.ema.max()) >= self.stable_confidence
+
+    def _result(self, entry: GenderCacheEntry, cached: bool) -> Dict[str, Any]:
+        return {
+            "index": int(entry.ema.argmax()),
+            "confidence": float(entry.ema.max()),
+            "samples": entry.samples,
+            "stable": self._is_stable(entry),
+            "cached": cached,
+        }
+
+    def lookup(self, session_id: str, signature: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Cached result if inference can be skipped for this face, else None."""
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(session_id)
+            if entry is None:
+                return None
+            entry.last_seen = now
+            if not self._is_stable(entry):
+                return None
+            if now - entry.last_inference >= self.refresh_interval:
+                return None
+            if not self._same_face(entry, signature):
+                return None
+            return self._result(entry, cached=True)
+
+    def update(self, session_id: str, probs: np.ndarray, signature: np.ndarray) -> Dict[str, Any]:
+        """Fold a fresh prediction into the session's average and return the smoothed result."""
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(session_id)
+            if entry is None or not self._same_face(entry, signature):
+                # New session or a different person: start over
+                self._evict(now)
+                entry = GenderCacheEntry(probs, signature, now)
+                self.entries[session_id] = entry
+            else:
+                entry.ema = (1.0 - self.alpha) * entry.ema + self.alpha * probs.astype(np.float32)
+                entry.samples += 1
+                entry.signature = signature
+                entry.last_inference = now
+                entry.last_seen = now
+            return self._result(entry, cached=False)
+
+    def reset(self, session_id: str):
+        with self._lock:
+            self.entries.pop(session_id, None)
+
+    def _evict(self, now: float):
+        stale = [sid for sid, e in self.entries.items() if now - e.last_seen > self.ttl]
+        for sid in stale:
+            del self.entries[sid]
+        if len(self.entries) >= self.max_sessions:
+            oldest = min(self.entries, key=lambda sid: self.entries[sid].last_seen)
+            del self.entries[oldest]
@@ -0,0 +1,183 @@
+"""
+Recorded (frame, landmarks) sequences for deterministic tests and benchmarks.
+
+A fixture is one .npz file:
+
+  jpeg        uint8, every frame's JPEG bytes concatenated
+  offsets     int64 (N + 1,) start of each frame in jpeg
+  landmarks   float32 (N, F, 478, 3) normalized FaceMesh landmarks (x, y, z)
+  faces       int8 (N,) number of valid faces per frame (rows past it are zero)
+  size        int32 (2,) recorded frame size (w, h)
+
+Landmarks stay normalized, so a fixture replays onto frames of any size.
+
+Record from a video:
+    python landmark_fixtures.py --video clip.mp4 --out fixtures/clip.npz --max-frames 300 --width 640
+
+Replay in FaceService (FaceMesh is never called for frames):
+    LANDMARK_REPLAY=fixtures/clip.npz uvicorn main:app
+    face_service.enable_replay("fixtures/clip.npz")
+"""
+import argparse
+import threading
+from collections import namedtuple
+from typing import Iterable, List
+
+import cv2
+import numpy as np
+
+NUM_LANDMARKS = 478
+
+# Shapes mirroring the parts of MediaPipe's FaceMesh result that FaceService reads
+ReplayPoint = namedtuple("ReplayPoint", ["x", "y", "z"])
+ReplayFace = namedtuple("ReplayFace", ["landmark"])
+ReplayResult = namedtuple("ReplayResult", ["multi_face_landmarks"])
+
+
+def record_fixture(video_path: str, out_path: str, max_frames: int = 0, every: int = 1,
+                   width: int = 0, max_faces: int = 1, quality: int = 90) -> int:
+    """Run FaceMesh over a video and write its frames and landmarks to out_path. Returns the frame count."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {video_path}")
+
+    def frames():
+        index = 0
+        kept = 0
+        while not max_frames or kept < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            index += 1
+            if (index - 1) % every:
+                continue
+            if width and frame.shape[1] != width:
+                height = int(round(frame.shape[0] * width / frame.shape[1]))
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            kept += 1
+            yield frame
+
+    try:
+        return record_frames(frames(), out_path, max_faces, quality, source=video_path)
+    finally:
+        cap.release()
+
+
+def record_frames(frames: Iterable[np.ndarray], out_path: str, max_faces: int = 1, quality: int = 90,
+                  static: bool = False, source: str = "frames") -> int:
+    """
+    Run FaceMesh over same-sized BGR frames and write them and their landmarks
+    to out_path. static=True detects every frame afresh (unrelated stills
+    rather than a video). Returns the frame count.
+    """
+    import mediapipe as mp
+
+    mesh = mp.solutions.face_mesh.FaceMesh(static_image_mode=static, max_num_faces=max_faces,
+                                           refine_landmarks=True, min_detection_confidence=0.5)
+    chunks, offsets, landmarks, faces = [], [0], [], []
+    size = None
+    for frame in frames:
+        if size is not None and (frame.shape[1], frame.shape[0]) != size:
+            raise ValueError(f"Frame size {frame.shape[1]}x{frame.shape[0]} differs from {size[0]}x{size[1]}")
+        size = (frame.shape[1], frame.shape[0])
+
+        res = mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        lm = np.zeros((max_faces, NUM_LANDMARKS, 3), dtype=np.float32)
+        found = res.multi_face_landmarks or []
+        for i, face in enumerate(found[:max_faces]):
+            lm[i] = [[p.x, p.y, p.z] for p in face.landmark[:NUM_LANDMARKS]]
+        landmarks.append(lm)
+        faces.append(min(len(found), max_faces))
+
+        data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].reshape(-1)
+        chunks.append(data)
+        offsets.append(offsets[-1] + len(data))
+    mesh.close()
+
+    if not faces:
+        raise ValueError(f"No frames read from {source}")
+    np.savez_compressed(
+        out_path,
+        jpeg=np.concatenate(chunks),
+        offsets=np.array(offsets, dtype=np.int64),
+        landmarks=np.stack(landmarks),
+        faces=np.array(faces, dtype=np.int8),
+        size=np.array(size, dtype=np.int32),
+    )
+    print(f"Recorded {len(faces)} frames ({int(np.count_nonzero(faces))} with a face) to {out_path}")
+    return len(faces)
+
+
+class LandmarkFixture:
+    """A loaded fixture: decoded frames on demand, landmarks per frame."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with np.load(path) as data:
+            self.jpeg = data["jpeg"]
+            self.offsets = data["offsets"]
+            self.landmarks = data["landmarks"]
+            self.faces = data["faces"]
+            self.size = tuple(int(v) for v in data["size"])
+
+    def __len__(self):
+        return len(self.faces)
+
+    def frame_jpeg(self, i: int) -> bytes:
+        return self.jpeg[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def frame(self, i: int) -> np.ndarray:
+        return cv2.imdecode(self.jpeg[self.offsets[i]:self.offsets[i + 1]], cv2.IMREAD_COLOR)
+
+    def face_landmarks(self, i: int) -> List[np.ndarray]:
+        """Normalized (478, 3) landmarks of every face in frame i."""
+        return [self.landmarks[i, f] for f in range(int(self.faces[i]))]
+
+
+class ReplayFaceMesh:
+    """
+    Drop-in for a FaceMesh instance: process() ignores the image and returns
+    the fixture's next recorded result, looping at the end. Results are built
+    once up front, so replay adds no per-frame cost.
+    """
+
+    def __init__(self, fixture: LandmarkFixture, max_num_faces: int = 1):
+        self.fixture = fixture
+        self._results = []
+        for i in range(len(fixture)):
+            faces = [ReplayFace([ReplayPoint(float(x), float(y), float(z)) for x, y, z in lm])
+                     for lm in fixture.face_landmarks(i)[:max_num_faces]]
+            self._results.append(ReplayResult(faces or None))
+        self._index = 0
+        self._lock = threading.Lock()
+
+    def process(self, image) -> ReplayResult:
+        with self._lock:
+            result = self._results[self._index]
+            self._index = (self._index + 1) % len(self._results)
+        return result
+
+    def reset(self, index: int = 0):
+        with self._lock:
+            self._index = index % len(self._results)
+
+    def close(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record a (frame, landmarks) fixture from a video")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--out", required=True, help="Output .npz")
+    parser.add_argument("--max-frames", type=int, default=0, help="Stop after N recorded frames (0 = all)")
+    parser.add_argument("--every", type=int, default=1, help="Keep every Nth frame")
+    parser.add_argument("--width", type=int, default=0, help="Resize frames to this width (0 = as recorded)")
+    parser.add_argument("--max-faces", type=int, default=1)
+    parser.add_argument("--quality", type=int, default=90, help="JPEG quality of the stored frames")
+    args = parser.parse_args()
+    record_fixture(args.video, args.out, args.max_frames, max(1, args.every), args.width,
+                   args.max_faces, args.quality)
+
+
+if __name__ == "__main__":
+    main()
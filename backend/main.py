@@ -1,9 +1,15 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, File, Form, HTTPException, Header, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 from typing import Optional
 from face_service import face_service
+from recording import available_codecs, default_codec
+from metrics import metrics
+from profiling import profiler
+from quality import QUALITY_TIERS
 import os
 
 app = FastAPI(title="Morphy Face API", description="Face morphing API for Morphy app")
@@ -20,7 +26,10 @@ app.add_middleware(
 # Serve sound files statically
 assets_dir = os.path.join(os.path.dirname(__file__), "..", "UI", "assets")
 if os.path.exists(assets_dir):
-    app.mount("/sounds", StaticFiles(directory=assets_dir), name="sounds")
+    sounds = StaticFiles(directory=assets_dir)
+    # Uploaded filters' sounds, looked up after the bundled ones (same /sounds/<folder>/<file> URLs)
+    sounds.all_directories.append(face_service.upload_dir)
+    app.mount("/sounds", sounds, name="sounds")
 
 
 class ProcessFrameRequest(BaseModel):
@@ -28,6 +37,8 @@ class ProcessFrameRequest(BaseModel):
     frame: str  # Base64 encoded image
     asset_id: str
     opacity: Optional[float] = 1.0
+    session_id: Optional[str] = "default"
+    multi_face: Optional[bool] = False  # Apply the filter to every face (up to MAX_FACES)
 
 
 class ProcessFrameResponse(BaseModel):
@@ -35,6 +46,8 @@ class ProcessFrameResponse(BaseModel):
     success: bool
     frame: Optional[str] = None  # Base64 encoded processed image
     mouth_open: Optional[bool] = None  # Whether mouth is detected as open
+    faces: Optional[int] = None  # Number of faces the filter was applied to
+    quality_tier: Optional[str] = None  # Session's adaptive quality tier (full ... minimal)
     message: Optional[str] = None
 
 
@@ -48,6 +61,96 @@ def hello():
     return {"message": "Hello from Python! 🐍"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus metrics: per-stage timings, frame counters and service gauges."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# Admin endpoints require the X-Admin-Token header when ADMIN_TOKEN is set
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def _check_admin(token: Optional[str]):
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+def _check_profiling_admin(token: Optional[str]):
+    """Profiling is off entirely unless ADMIN_TOKEN is set, then needs the token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Profiling is disabled; set ADMIN_TOKEN to enable it")
+    _check_admin(token)
+
+
+@app.get("/admin/flight-recorder")
+def get_flight_recorder(session_id: Optional[str] = None, dump: bool = False,
+                        x_admin_token: Optional[str] = Header(None)):
+    """Last frames per session (timings, size, asset, landmark source, outcome); dump=true also writes a file."""
+    _check_admin(x_admin_token)
+    result = {
+        "sessions": face_service.flight_recorder.snapshot(session_id),
+        "dumps": face_service.flight_recorder.list_dumps(),
+    }
+    if dump:
+        result["dump_path"] = face_service.flight_recorder.dump(session_id)
+    return result
+
+
+@app.get("/admin/quality")
+def get_quality(x_admin_token: Optional[str] = Header(None)):
+    """Adaptive quality: target, tiers and every session's current tier and recent latencies."""
+    _check_admin(x_admin_token)
+    return {
+        "target_ms": face_service.quality.target_ms,
+        "enabled": face_service.quality.enabled,
+        "tiers": QUALITY_TIERS,
+        "sessions": face_service.quality.snapshot(),
+    }
+
+
+class ProfilingWindowRequest(BaseModel):
+    seconds: float = 30.0
+    mode: str = "cprofile"  # cprofile (.pstats) or sampler (collapsed stacks)
+
+
+@app.post("/admin/profiling")
+def start_profiling(request: ProfilingWindowRequest, x_admin_token: Optional[str] = Header(None)):
+    """Profile every process_frame / detect_gender call for the next `seconds`."""
+    _check_profiling_admin(x_admin_token)
+    try:
+        window_id = profiler.start_window(request.seconds, request.mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"window_id": window_id, "mode": request.mode, "seconds": request.seconds}
+
+
+@app.delete("/admin/profiling")
+def stop_profiling(x_admin_token: Optional[str] = Header(None)):
+    _check_profiling_admin(x_admin_token)
+    profiler.stop_window()
+    return profiler.status()
+
+
+@app.get("/admin/profiling")
+def get_profiling(x_admin_token: Optional[str] = Header(None)):
+    _check_profiling_admin(x_admin_token)
+    return profiler.status()
+
+
+@app.get("/admin/profiling/{profile_id}")
+def download_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """One profile, or all profiles of a window merged (.pstats or .collapsed)."""
+    _check_profiling_admin(x_admin_token)
+    exported = profiler.export(profile_id)
+    if exported is None:
+        raise HTTPException(status_code=404, detail=f"No profile '{profile_id}'")
+    path, filename, temporary = exported
+    # Merged profiles are built per download and removed once sent
+    return FileResponse(path, media_type="application/octet-stream", filename=filename,
+                        background=BackgroundTask(os.remove, path) if temporary else None)
+
+
 @app.get("/categories")
 def get_categories():
     """Get list of available filter categories."""
@@ -64,31 +167,108 @@ def get_category_assets(category: str):
     return {"category": category, "assets": assets}
 
 
+def _call_service(response: Response, x_profile: Optional[str], x_admin_token: Optional[str],
+                  label: str, fn, *args, **kwargs):
+    """Run a FaceService call, under the profiler when the request or an admin window asks for it."""
+    if profiler.requested_mode(x_profile):
+        _check_profiling_admin(x_admin_token)
+    mode = profiler.mode_for(x_profile)
+    if mode is None:
+        return fn(*args, **kwargs)
+    result, profile_id = profiler.run(mode, label, fn, *args, **kwargs)
+    response.headers["X-Profile-Id"] = profile_id
+    return result
+
+
+# Multipart framing and the category field, on top of the uploaded files themselves
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject an oversized POST /assets from its Content-Length, before the body is parsed."""
+    if request.method == "POST" and request.url.path == "/assets":
+        length = request.headers.get("content-length", "")
+        if length.isdigit() and int(length) > face_service.uploads.max_bytes + UPLOAD_OVERHEAD_BYTES:
+            return JSONResponse(status_code=413,
+                                content={"detail": f"Upload larger than {face_service.uploads.max_bytes} bytes"})
+    return await call_next(request)
+
+
+async def _read_limited(upload: UploadFile, limit: int) -> bytes:
+    """Read an uploaded file in chunks, stopping with 413 once it passes limit bytes."""
+    data = bytearray()
+    while True:
+        chunk = await upload.read(64 * 1024)
+        if not chunk:
+            return bytes(data)
+        data += chunk
+        if len(data) > limit:
+            raise HTTPException(status_code=413, detail=f"Upload larger than {face_service.uploads.max_bytes} bytes")
+
+
+@app.post("/assets", status_code=202)
+async def upload_asset(category: str = Form(...), image: UploadFile = File(...),
+                       sound: Optional[UploadFile] = File(None), x_admin_token: Optional[str] = Header(None)):
+    """Queue a new filter (image, optional .wav/.mp3 sound) for preprocessing; poll /assets/jobs/{job_id}."""
+    _check_admin(x_admin_token)
+    image_bytes = await _read_limited(image, face_service.uploads.max_bytes)
+    sound_bytes = await _read_limited(sound, face_service.uploads.max_bytes - len(image_bytes)) if sound is not None else None
+    try:
+        job = face_service.uploads.submit(category, image.filename or "", image_bytes,
+                                          sound.filename if sound is not None else None, sound_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job["status_url"] = f"/assets/jobs/{job['job_id']}"
+    return job
+
+
+@app.get("/assets/jobs/{job_id}")
+def get_asset_job(job_id: str):
+    """Upload job: queued, processing, done (with asset_id) or failed (with error)."""
+    job = face_service.uploads.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No upload job '{job_id}'")
+    return job
+
+
 @app.post("/process-frame", response_model=ProcessFrameResponse)
-def process_frame(request: ProcessFrameRequest):
-    """Process a frame with face morphing."""
+def process_frame(request: ProcessFrameRequest, response: Response,
+                  x_profile: Optional[str] = Header(None), x_admin_token: Optional[str] = Header(None)):
+    """Process a frame with face morphing. X-Profile: cprofile|sampler profiles this call."""
     try:
-        result = face_service.process_frame(
+        result = _call_service(
+            response, x_profile, x_admin_token, "process_frame", face_service.process_frame,
             frame_b64=request.frame,
             asset_id=request.asset_id,
-            opacity=request.opacity
+            opacity=request.opacity,
+            session_id=request.session_id or "default",
+            multi_face=bool(request.multi_face)
         )
         
         if result:
             return ProcessFrameResponse(
                 success=True, 
                 frame=result.get("frame"),
-                mouth_open=result.get("mouth_open", False)
+                mouth_open=result.get("mouth_open", False),
+                faces=result.get("faces"),
+                quality_tier=result.get("quality_tier")
             )
         else:
             return ProcessFrameResponse(success=False, message="Could not process frame")
+    except HTTPException:
+        raise
     except Exception as e:
+        metrics.errors.inc("process_frame")
+        face_service.flight_recorder.record(request.session_id or "default", "process_frame", "error",
+                                            asset_id=request.asset_id, error=str(e))
         return ProcessFrameResponse(success=False, message=str(e))
 
 
 class GenderDetectRequest(BaseModel):
     """Request model for gender detection."""
     frame: str  # Base64 encoded image
+    session_id: Optional[str] = "default"
 
 
 class GenderResponse(BaseModel):
@@ -99,11 +279,14 @@ class GenderResponse(BaseModel):
 
 
 @app.post("/detect-gender", response_model=GenderResponse)
-def detect_gender(request: GenderDetectRequest):
+def detect_gender(request: GenderDetectRequest, response: Response,
+                  x_profile: Optional[str] = Header(None), x_admin_token: Optional[str] = Header(None)):
     """Key endpoint for gender detection."""
-    result = face_service.detect_gender(request.frame)
+    result = _call_service(response, x_profile, x_admin_token, "detect_gender", face_service.detect_gender,
+                           request.frame, session_id=request.session_id or "default")
     
     if "error" in result:
+        metrics.errors.inc("detect_gender")
         return GenderResponse(gender="Unknown", confidence=0.0, error=result["error"])
         
     return GenderResponse(
@@ -114,22 +297,107 @@ def detect_gender(request: GenderDetectRequest):
 
 
 class RecordingRequest(BaseModel):
-    width: int = 640
-    height: int = 480
+    width: Optional[int] = None  # Defaults to the first frame's size
+    height: Optional[int] = None
     fps: int = 20
+    codec: Optional[str] = None  # See /recording-codecs
+    session_id: Optional[str] = "default"
+
+
+class StopRecordingRequest(BaseModel):
+    session_id: Optional[str] = "default"
+
+
+RECORDING_CHUNK_SIZE = 256 * 1024
+
+
+def _iter_file_range(path: str, start: int, end: int):
+    """Yield bytes [start, end] of a file in fixed-size chunks."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(RECORDING_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@app.get("/recording-codecs")
+def get_recording_codecs():
+    """Codecs usable for recordings on this server."""
+    return {"codecs": available_codecs(), "default": default_codec()}
 
 @app.post("/start-recording")
 def start_recording(request: RecordingRequest):
-    success = face_service.start_recording(request.width, request.height, request.fps)
+    if request.codec and request.codec not in available_codecs():
+        raise HTTPException(status_code=400, detail=f"Unsupported codec '{request.codec}'")
+    success = face_service.start_recording(
+        request.width, request.height, request.fps,
+        session_id=request.session_id or "default",
+        codec=request.codec
+    )
     if success:
         return {"success": True, "message": "Recording started"}
     else:
         raise HTTPException(status_code=500, detail="Failed to start recording")
 
 @app.post("/stop-recording")
-def stop_recording():
-    video_b64 = face_service.stop_recording()
-    if video_b64:
-        return {"success": True, "video": video_b64}
+def stop_recording(request: Optional[StopRecordingRequest] = None):
+    session_id = (request.session_id if request else None) or "default"
+    info = face_service.stop_recording(session_id)
+    if info:
+        return {
+            "success": True,
+            "video_url": f"/recordings/{info['download_token']}",
+            "filename": info["filename"],
+            "codec": info["codec"],
+            "frames": info["frames"],
+            "size_bytes": info["size_bytes"],
+            "write_seconds": info["write_seconds"],
+            "encode_seconds": info["encode_seconds"]
+        }
     else:
         return {"success": False, "message": "No video recorded or error reading file"}
+
+@app.get("/recordings/{token}")
+def download_recording(token: str, range: Optional[str] = Header(None)):
+    """Stream a finished recording from disk (token from /stop-recording), honouring single byte-range requests."""
+    recording = face_service.get_recording(token)
+    if recording is None:
+        raise HTTPException(status_code=404, detail="No recording for this download token")
+
+    path = recording["path"]
+    media_type = recording["media_type"]
+    file_size = os.path.getsize(path)
+    if not range:
+        return FileResponse(path, media_type=media_type, filename=recording["filename"],
+                            headers={"Accept-Ranges": "bytes"})
+
+    try:
+        unit, _, spec = range.partition("=")
+        start_s, _, end_s = spec.split(",")[0].strip().partition("-")
+        if unit.strip() != "bytes":
+            raise ValueError(unit)
+        if start_s:
+            start = int(start_s)
+            end = int(end_s) if end_s else file_size - 1
+        else:
+            # Suffix range: last N bytes
+            start = max(0, file_size - int(end_s))
+            end = file_size - 1
+        end = min(end, file_size - 1)
+        if start > end:
+            raise ValueError(range)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Invalid range",
+                            headers={"Content-Range": f"bytes */{file_size}"})
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Range": f"bytes {start}-{end}/{file_size}",
+        "Content-Length": str(end - start + 1),
+    }
+    return StreamingResponse(_iter_file_range(path, start, end), status_code=206,
+                             media_type=media_type, headers=headers)
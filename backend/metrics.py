@@ -0,0 +1,163 @@
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Stage durations range from ~0.1 ms (base64) to seconds (asset preprocessing)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items()) or ([((), 0.0)] if not self.labels else [])
+        for values, v in items:
+            lines.append(f"{self.name}{_label_str(self.labels, values)} {v}")
+        return lines
+
+
+class Gauge:
+    """A gauge read from a callback at scrape time."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        self.name, self.help, self.fn = name, help, fn
+
+    def render(self) -> List[str]:
+        try:
+            value = float(self.fn())
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0.0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for values, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, values)} {series[-1]}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, values)} {cumulative}")
+        return lines
+
+
+class StageTimer:
+    """
+    Times consecutive stages of one operation: each lap() records the time
+    since the previous lap under that stage name; finish() records the total.
+    The durations are also kept in .stages (seconds) for the caller.
+    """
+
+    def __init__(self, histogram: Histogram, op: str):
+        self.histogram = histogram
+        self.op = op
+        self.stages: Dict[str, float] = {}
+        self.start = self._last = time.perf_counter()
+
+    def lap(self, stage: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+        self.histogram.observe(elapsed, self.op, stage)
+        return elapsed
+
+    def finish(self) -> float:
+        total = time.perf_counter() - self.start
+        self.stages["total"] = total
+        self.histogram.observe(total, self.op, "total")
+        return total
+
+
+def resident_memory_bytes() -> float:
+    """Current RSS from /proc (Linux), otherwise peak RSS from getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if os.uname().sysname == "Darwin" else rss * 1024
+    return 0.0
+
+
+class Metrics:
+    """The service's metrics, rendered in the Prometheus text format by render()."""
+
+    def __init__(self):
+        self.stage_seconds = Histogram("morphy_stage_seconds", "Time spent per operation stage",
+                                       labels=("op", "stage"))
+        self.frames = Counter("morphy_frames_total", "Frames received by process_frame")
+        self.no_face_frames = Counter("morphy_no_face_frames_total", "Frames where no face was found")
+        self.dropped_frames = Counter("morphy_dropped_frames_total", "Frames that could not be decoded")
+        self.errors = Counter("morphy_errors_total", "Failed requests", labels=("op",))
+        self.gender_requests = Counter("morphy_gender_requests_total", "Gender detections by face source",
+                                       labels=("source",))
+        self.quality_changes = Counter("morphy_quality_tier_changes_total", "Session quality tier changes",
+                                       labels=("direction",))
+        self.gauges: List[Gauge] = [
+            Gauge("morphy_process_resident_memory_bytes", "Resident memory of this process", resident_memory_bytes),
+        ]
+
+    def timer(self, op: str) -> StageTimer:
+        return StageTimer(self.stage_seconds, op)
+
+    def add_gauge(self, name: str, help: str, fn: Callable[[], float]):
+        self.gauges.append(Gauge(name, help, fn))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in (self.stage_seconds, self.frames, self.no_face_frames, self.dropped_frames,
+                       self.errors, self.gender_requests, self.quality_changes, *self.gauges):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,186 @@
+import cProfile
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PROFILE_MODES = ("cprofile", "sampler")
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack every interval seconds from a helper
+    thread and counts collapsed stacks ("root;caller;callee"), the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.002):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+class Profiler:
+    """
+    Opt-in profiling of FaceService calls. A call is profiled when its request
+    asks for it (X-Profile header) or while a window started from the admin
+    endpoint is open; otherwise run() is a plain function call.
+
+    Each profiled call writes <id>.pstats (cProfile) or <id>.collapsed (stack
+    sampler) to out_dir; calls made during a window share the window id as a
+    prefix so they can be downloaded merged.
+    """
+
+    def __init__(self, out_dir: Optional[str] = None, max_files: int = 500):
+        self.out_dir = out_dir or os.path.join(tempfile.gettempdir(), "morphy_profiles")
+        self.max_files = max_files
+        self.window_until = 0.0
+        self.window_mode = "cprofile"
+        self.window_id: Optional[str] = None
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def requested_mode(header: Optional[str]) -> Optional[str]:
+        """Mode an X-Profile header asks for; anything but a known mode ("off", "0", ...) asks for none."""
+        mode = (header or "").strip().lower()
+        return mode if mode in PROFILE_MODES else None
+
+    def mode_for(self, header: Optional[str]) -> Optional[str]:
+        """Profiling mode for a request, or None to run unprofiled."""
+        requested = self.requested_mode(header)
+        if requested:
+            return requested
+        if self.window_until and time.time() < self.window_until:
+            return self.window_mode
+        return None
+
+    def start_window(self, seconds: float, mode: str = "cprofile") -> str:
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'")
+        with self._lock:
+            self.window_id = f"window{time.strftime('%Y%m%d_%H%M%S')}"
+            self.window_mode = mode
+            self.window_until = time.time() + seconds
+        return self.window_id
+
+    def stop_window(self):
+        with self._lock:
+            self.window_until = 0.0
+
+    def status(self) -> Dict[str, Any]:
+        active = bool(self.window_until and time.time() < self.window_until)
+        return {
+            "window_active": active,
+            "window_id": self.window_id if active else None,
+            "window_mode": self.window_mode if active else None,
+            "seconds_left": round(self.window_until - time.time(), 1) if active else 0,
+            "profiles": self.list_profiles(),
+        }
+
+    def run(self, mode: str, label: str, fn: Callable, *args, **kwargs) -> Tuple[Any, str]:
+        """Call fn under the given profiler; returns (fn's result, profile id)."""
+        with self._lock:
+            self._seq += 1
+            window = self.window_id if self.window_until and time.time() < self.window_until else None
+            profile_id = f"{window + '_' if window else ''}{label}_{int(time.time())}_{self._seq}"
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        if mode == "sampler":
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                sampler.stop()
+                self._write_collapsed(os.path.join(self.out_dir, profile_id + ".collapsed"), sampler.stacks)
+        else:
+            prof = cProfile.Profile()
+            prof.enable()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                prof.disable()
+                prof.dump_stats(os.path.join(self.out_dir, profile_id + ".pstats"))
+        self._prune()
+        return result, profile_id
+
+    def list_profiles(self) -> List[str]:
+        if not os.path.isdir(self.out_dir):
+            return []
+        return sorted(f for f in os.listdir(self.out_dir) if f.endswith((".pstats", ".collapsed")))
+
+    def export(self, profile_id: str) -> Optional[Tuple[str, str, bool]]:
+        """
+        (path, download file name, temporary) of a downloadable profile. A
+        window id (or any id prefix) merges every matching profile of the same
+        format into a temporary file outside out_dir, which the caller deletes
+        once it has been sent.
+        """
+        names = [f for f in self.list_profiles() if f.startswith(profile_id)]
+        if not names:
+            return None
+        exact = [f for f in names if os.path.splitext(f)[0] == profile_id]
+        if exact:
+            return os.path.join(self.out_dir, exact[0]), exact[0], False
+
+        paths = [os.path.join(self.out_dir, f) for f in names]
+        ext = ".pstats" if paths[0].endswith(".pstats") else ".collapsed"
+        fd, merged = tempfile.mkstemp(prefix=f"merged_{profile_id}_", suffix=ext)
+        os.close(fd)
+        if ext == ".pstats":
+            paths = [p for p in paths if p.endswith(".pstats")]
+            pstats.Stats(*paths).dump_stats(merged)
+        else:
+            stacks: Counter = Counter()
+            for path in (p for p in paths if p.endswith(".collapsed")):
+                with open(path) as f:
+                    for line in f:
+                        stack, _, count = line.rstrip("\n").rpartition(" ")
+                        stacks[stack] += int(count)
+            self._write_collapsed(merged, stacks)
+        return merged, f"merged_{profile_id}{ext}", True
+
+    @staticmethod
+    def _write_collapsed(path: str, stacks: Counter):
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def _prune(self):
+        names = self.list_profiles()
+        if len(names) <= self.max_files:
+            return
+        paths = sorted((os.path.join(self.out_dir, f) for f in names), key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+profiler = Profiler(os.environ.get("PROFILE_DIR"))
@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+# Cheapest last. mesh_width: FaceMesh input width (0 = full frame); detect_every: run
+# FaceMesh every N frames and reuse the landmarks in between; asset_level: asset
+# pyramid level (each level halves the asset image); warp_step: warp triangulation
+# over the contour landmarks plus every Nth other one (1 = full mesh, 0 = contours
+# only); jpeg_quality: output encoding; refine_landmarks: iris refinement (off =
+# the lighter 468-point mesh)
+QUALITY_TIERS: List[Dict[str, Any]] = [
+    {"name": "full", "mesh_width": 0, "detect_every": 1, "asset_level": 0, "warp_step": 1,
+     "jpeg_quality": 95, "refine_landmarks": True},
+    {"name": "high", "mesh_width": 640, "detect_every": 1, "asset_level": 0, "warp_step": 2,
+     "jpeg_quality": 85, "refine_landmarks": True},
+    {"name": "medium", "mesh_width": 480, "detect_every": 2, "asset_level": 1, "warp_step": 4,
+     "jpeg_quality": 75, "refine_landmarks": False},
+    {"name": "low", "mesh_width": 320, "detect_every": 3, "asset_level": 1, "warp_step": 8,
+     "jpeg_quality": 65, "refine_landmarks": False},
+    {"name": "minimal", "mesh_width": 256, "detect_every": 4, "asset_level": 2, "warp_step": 0,
+     "jpeg_quality": 55, "refine_landmarks": False},
+]
+
+
+class QualityState:
+    """Latency history and current tier of one session."""
+
+    def __init__(self, window: int):
+        self.tier = 0
+        self.latencies: deque = deque(maxlen=window)
+        self.frames_at_tier = 0
+
+
+class QualityController:
+    """
+    Keeps each session's processing latency near target_ms by moving it along
+    QUALITY_TIERS.
+
+    The median of the last `window` frames is compared with the target: above
+    it the session steps one tier down (after at least min_frames at the
+    current tier); below up_ratio * target it steps one tier back up, but only
+    after hold_frames at the current tier. The gap between the two thresholds
+    and the longer hold before upgrading keep a session from oscillating.
+    A target of 0 disables the controller (every session stays at "full").
+    """
+
+    def __init__(self, target_ms: float = 0.0, window: int = 15, min_frames: int = 8,
+                 up_ratio: float = 0.6, hold_frames: int = 45, max_tier: Optional[int] = None,
+                 max_sessions: int = 256):
+        self.target_ms = target_ms
+        self.window = window
+        self.min_frames = min_frames
+        self.up_ratio = up_ratio
+        self.hold_frames = hold_frames
+        self.max_tier = len(QUALITY_TIERS) - 1 if max_tier is None else min(max_tier, len(QUALITY_TIERS) - 1)
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, QualityState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.target_ms > 0
+
+    def tier_for(self, session_id: str) -> Tuple[int, Dict[str, Any]]:
+        """Current (index, tier settings) of a session."""
+        if not self.enabled:
+            return 0, QUALITY_TIERS[0]
+        with self._lock:
+            state = self.sessions.get(session_id)
+            index = state.tier if state is not None else 0
+        return index, QUALITY_TIERS[index]
+
+    def report(self, session_id: str, latency_ms: float) -> Optional[str]:
+        """Record one frame's latency; returns "down" or "up" when the session changed tier."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            state = self.sessions.get(session_id)
+            if state is None:
+                if len(self.sessions) >= self.max_sessions:
+                    self.sessions.popitem(last=False)
+                state = self.sessions[session_id] = QualityState(self.window)
+            else:
+                self.sessions.move_to_end(session_id)
+            state.latencies.append(latency_ms)
+            state.frames_at_tier += 1
+
+            if len(state.latencies) < min(self.min_frames, self.window):
+                return None
+            median = sorted(state.latencies)[len(state.latencies) // 2]
+            change = None
+            if median > self.target_ms and state.tier < self.max_tier:
+                state.tier += 1
+                change = "down"
+            elif (median < self.target_ms * self.up_ratio and state.tier > 0
+                  and state.frames_at_tier >= self.hold_frames):
+                state.tier -= 1
+                change = "up"
+            if change:
+                # Judge the new tier on its own frames only
+                state.latencies.clear()
+                state.frames_at_tier = 0
+            return change
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {sid: {"tier": QUALITY_TIERS[s.tier]["name"], "frames_at_tier": s.frames_at_tier,
+                          "recent_ms": [round(v, 1) for v in s.latencies]}
+                    for sid, s in self.sessions.items()}
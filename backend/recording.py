@@ -0,0 +1,306 @@
+import cv2
+import os
+import re
+import secrets
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Any
+
+
+# Codecs selectable per recording. "fourcc" codecs go through cv2.VideoWriter,
+# "ffmpeg" codecs pipe raw BGR frames into a local ffmpeg binary.
+CODECS: Dict[str, Dict[str, Any]] = {
+    "mjpg": {"fourcc": "MJPG", "ext": ".avi", "media_type": "video/x-msvideo"},
+    "mp4v": {"fourcc": "mp4v", "ext": ".mp4", "media_type": "video/mp4"},
+    "h264": {"ffmpeg": ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23"],
+             "ext": ".mp4", "media_type": "video/mp4"},
+}
+FALLBACK_CODEC = "mjpg"
+
+
+def find_ffmpeg() -> Optional[str]:
+    return shutil.which("ffmpeg")
+
+
+def available_codecs() -> List[str]:
+    """Codecs that can be used on this machine."""
+    has_ffmpeg = find_ffmpeg() is not None
+    return [name for name, spec in CODECS.items() if "ffmpeg" not in spec or has_ffmpeg]
+
+
+def default_codec() -> str:
+    """Smallest output available: H.264 through ffmpeg if present, else MPEG-4 Part 2."""
+    return "h264" if find_ffmpeg() else "mp4v"
+
+
+class FfmpegWriter:
+    """
+    Minimal cv2.VideoWriter look-alike that pipes raw frames to ffmpeg.
+    Once ffmpeg has exited or a write fails, isOpened() is False and further
+    writes are dropped.
+    """
+
+    def __init__(self, path: str, fps: float, size, codec_args: List[str]):
+        w, h = size
+        cmd = [
+            find_ffmpeg() or "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-r", str(fps),
+            "-i", "-",
+            *codec_args,
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            path,
+        ]
+        self.cpu_seconds = 0.0
+        self.failed = False
+        try:
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        except OSError as e:
+            print(f"Error starting ffmpeg: {e}")
+            self.proc = None
+
+    def isOpened(self) -> bool:
+        return self.proc is not None and not self.failed and self.proc.poll() is None
+
+    def write(self, frame):
+        if self.failed or self.proc is None:
+            return
+        try:
+            self.proc.stdin.write(frame.tobytes())
+        except (OSError, ValueError) as e:
+            self.failed = True
+            print(f"Error writing to ffmpeg (exit code {self.proc.poll()}), dropping further frames: {e}")
+
+    def release(self):
+        """Close the pipe and wait for ffmpeg; cpu_seconds is then ffmpeg's own user + system time."""
+        if self.proc is None:
+            return
+        start = time.perf_counter()
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            _, status, usage = os.wait4(self.proc.pid, 0)
+            self.proc.returncode = os.waitstatus_to_exitcode(status)
+            self.cpu_seconds = usage.ru_utime + usage.ru_stime
+        except (AttributeError, ChildProcessError):
+            # No wait4 (Windows): the wait for ffmpeg to finish is the closest figure
+            self.proc.wait()
+            self.cpu_seconds = time.perf_counter() - start
+        self.proc = None
+
+
+class RecordingSession:
+    """Video writer state for a single client session."""
+
+    def __init__(self, session_id: str, base_path: str, codec: str,
+                 width: Optional[int] = None, height: Optional[int] = None, fps: int = 20):
+        self.session_id = session_id
+        self.base_path = base_path
+        self.codec = codec
+        self.path = base_path + CODECS[codec]["ext"]
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.writer = None
+        self.frames_count = 0
+        self.write_seconds = 0.0  # resize + writer.write per frame, i.e. what recording adds to process_frame
+        self.encode_seconds = 0.0  # encoder time: the writer calls for OpenCV codecs, ffmpeg's own CPU time for ffmpeg codecs
+        self.active = True
+        self.finished_at: Optional[float] = None
+        self.download_token: Optional[str] = None  # set by RecordingManager.stop()
+        self.lock = threading.Lock()
+
+    @property
+    def media_type(self) -> str:
+        return CODECS[self.codec]["media_type"]
+
+    @property
+    def filename(self) -> str:
+        return "morphy_video" + CODECS[self.codec]["ext"]
+
+    def _open_writer(self, size):
+        spec = CODECS[self.codec]
+        self.path = self.base_path + spec["ext"]
+        if "ffmpeg" in spec:
+            return FfmpegWriter(self.path, self.fps, size, spec["ffmpeg"])
+        fourcc = cv2.VideoWriter_fourcc(*spec["fourcc"])
+        return cv2.VideoWriter(self.path, fourcc, float(self.fps), size)
+
+    def write(self, frame):
+        with self.lock:
+            if not self.active:
+                return
+            if self.writer is None:
+                # Requested size wins, otherwise use the first frame's size
+                frame_h, frame_w = frame.shape[:2]
+                self.width = self.width or frame_w
+                self.height = self.height or frame_h
+                if "ffmpeg" in CODECS[self.codec]:
+                    # yuv420p needs even dimensions
+                    self.width -= self.width % 2
+                    self.height -= self.height % 2
+                self.writer = self._open_writer((self.width, self.height))
+            # Checked on every frame: ffmpeg only fails on a missing encoder or bad size once frames arrive
+            if not self.writer.isOpened() and self.codec != FALLBACK_CODEC:
+                self._fall_back()
+
+            start = time.perf_counter()
+            if frame.shape[1] != self.width or frame.shape[0] != self.height:
+                frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+            write_start = time.perf_counter()
+            self.writer.write(frame)
+            end = time.perf_counter()
+            self.write_seconds += end - start
+            if not isinstance(self.writer, FfmpegWriter):
+                self.encode_seconds += end - write_start
+            self.frames_count += 1
+
+    def _fall_back(self):
+        """Replace a writer that failed to open or died with FALLBACK_CODEC; frames sent to it are lost."""
+        print(f"Codec {self.codec} failed after {self.frames_count} frames, falling back to {FALLBACK_CODEC}")
+        self.writer.release()
+        if os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                print(f"Error removing failed recording {self.path}: {e}")
+        self.codec = FALLBACK_CODEC
+        self.frames_count = 0
+        self.writer = self._open_writer((self.width, self.height))
+
+    def close(self):
+        with self.lock:
+            self.active = False
+            if self.writer is not None:
+                start = time.perf_counter()
+                self.writer.release()
+                if isinstance(self.writer, FfmpegWriter):
+                    # ffmpeg encodes concurrently with the pipe writes; count its own CPU time
+                    self.encode_seconds += self.writer.cpu_seconds
+                else:
+                    self.encode_seconds += time.perf_counter() - start
+                self.writer = None
+            self.finished_at = time.time()
+
+
+class RecordingManager:
+    """
+    Keeps one recording per session id, each written to its own temp file.
+    Finished recordings stay on disk for download until the session starts
+    a new recording or the file expires; expired files are removed by a
+    background sweep every cleanup_interval seconds and on start/stop/download.
+    Downloads are keyed by a random token from stop(), not the client-chosen
+    session id.
+    """
+
+    def __init__(self, base_dir: Optional[str] = None, max_age: float = 3600.0, cleanup_interval: float = 300.0):
+        self.base_dir = base_dir or tempfile.mkdtemp(prefix="morphy_recordings_")
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.max_age = max_age
+        self.sessions: Dict[str, RecordingSession] = {}
+        self._lock = threading.Lock()
+        if cleanup_interval > 0:
+            threading.Thread(target=self._cleanup_loop, args=(cleanup_interval,),
+                             name="recording-cleanup", daemon=True).start()
+
+    def _cleanup_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.cleanup_stale()
+            except Exception as e:
+                print(f"Error cleaning up recordings: {e}")
+
+    def _new_base_path(self, session_id: str) -> str:
+        safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', session_id)[:64]
+        return os.path.join(self.base_dir, f"{safe_id}_{uuid.uuid4().hex}")
+
+    def _discard(self, session: RecordingSession):
+        session.close()
+        if os.path.exists(session.path):
+            try:
+                os.remove(session.path)
+            except OSError as e:
+                print(f"Error removing recording {session.path}: {e}")
+
+    def cleanup_stale(self):
+        """Remove finished recordings older than max_age seconds."""
+        now = time.time()
+        with self._lock:
+            stale = [sid for sid, s in self.sessions.items()
+                     if s.finished_at is not None and now - s.finished_at > self.max_age]
+            for sid in stale:
+                self._discard(self.sessions.pop(sid))
+
+    def start(self, session_id: str, width: Optional[int] = None, height: Optional[int] = None,
+              fps: int = 20, codec: Optional[str] = None) -> RecordingSession:
+        codec = codec or default_codec()
+        if codec not in available_codecs():
+            raise ValueError(f"Unsupported codec '{codec}', available: {available_codecs()}")
+
+        self.cleanup_stale()
+        session = RecordingSession(session_id, self._new_base_path(session_id), codec, width, height, fps)
+        with self._lock:
+            previous = self.sessions.get(session_id)
+            self.sessions[session_id] = session
+        if previous is not None:
+            self._discard(previous)
+        return session
+
+    def is_recording(self, session_id: str) -> bool:
+        session = self.sessions.get(session_id)
+        return session is not None and session.active
+
+    def write(self, session_id: str, frame):
+        session = self.sessions.get(session_id)
+        if session is not None and session.active:
+            session.write(frame)
+
+    def stop(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Finalize a session's recording. Returns file info, encode stats and the
+        download token, or None if nothing was recorded.
+        """
+        self.cleanup_stale()
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        session.close()
+
+        if session.frames_count == 0 or not os.path.exists(session.path):
+            with self._lock:
+                if self.sessions.get(session_id) is session:
+                    del self.sessions[session_id]
+            self._discard(session)
+            return None
+
+        if session.download_token is None:
+            session.download_token = secrets.token_urlsafe(24)
+        return {
+            "path": session.path,
+            "download_token": session.download_token,
+            "filename": session.filename,
+            "codec": session.codec,
+            "width": session.width,
+            "height": session.height,
+            "fps": session.fps,
+            "frames": session.frames_count,
+            "size_bytes": os.path.getsize(session.path),
+            "write_seconds": round(session.write_seconds, 4),
+            "encode_seconds": round(session.encode_seconds, 4),
+        }
+
+    def get_finished(self, token: str) -> Optional[RecordingSession]:
+        """Finished recording with this download token, if any."""
+        self.cleanup_stale()
+        with self._lock:
+            session = next((s for s in self.sessions.values()
+                            if s.download_token is not None and secrets.compare_digest(s.download_token, token)), None)
+        if session is None or session.active or not os.path.exists(session.path):
+            return None
+        return session
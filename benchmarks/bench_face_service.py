@@ -0,0 +1,307 @@
+"""
+Micro-benchmarks for the FaceService hot paths:
+
+  delaunay      calculate_delaunay on 478 landmarks + 8 boundary points
+  warp          warp_face_transparent  x frame size x asset size x opacity
+  overlay       apply_overlay          x frame size x overlay asset x opacity
+  process_asset _process_asset on the asset photos (load-time cost)
+  process_frame end-to-end process_frame (decode, warp, encode)
+
+Faces are placed from a landmark fixture (fixtures/landmarks.npz in the
+landmark_fixtures.py format, recorded once from the asset photos with
+--record-fixtures), so no camera is needed and every run warps the same
+geometry. process_frame runs on the fixture's frames with FaceMesh replayed
+from it, so only the code under test is timed; --replay swaps in a recorded
+video fixture and --live-mesh runs the real FaceMesh instead.
+
+Results are written as JSON; --baseline compares the p50 of every case
+against a stored run and exits with status 1 on a regression.
+
+Usage:
+    python benchmarks/bench_face_service.py --json bench.json
+    python benchmarks/bench_face_service.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_face_service.py --baseline benchmarks/baseline.json --tolerance 0.2
+    python benchmarks/bench_face_service.py --only warp,overlay --quick
+    python benchmarks/bench_face_service.py --only process_frame --replay benchmarks/fixtures/clip.npz
+    python benchmarks/bench_face_service.py --only process_frame --live-mesh
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "backend"))
+from face_service import face_service
+from landmark_fixtures import LandmarkFixture, record_frames
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "landmarks.npz")
+FIXTURE_PHOTOS = ["Celebs", "Races"]  # asset folders with real, frontal faces
+FIXTURE_SIZE = (640, 480)  # photos are letterboxed into frames of this size
+
+FRAME_SIZES = {"480p": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+ASSET_SIZES = [512, 1024, 0]  # longest side in px, 0 = as loaded
+OPACITIES = [0.5, 1.0]
+FACE_HEIGHT = 0.45  # face height as a fraction of the frame height
+
+
+# -----------------------------
+# FIXTURES
+# -----------------------------
+def fixture_photos():
+    """Asset photos the fixture is recorded from, relative to the assets directory."""
+    photos = []
+    for folder in FIXTURE_PHOTOS:
+        folder_path = os.path.join(face_service.assets_dir, folder)
+        photos.extend(f"{folder}/{name}" for name in sorted(os.listdir(folder_path))
+                      if name.lower().endswith((".png", ".webp", ".jpg", ".jpeg")))
+    return photos
+
+
+def record_fixtures(path=FIXTURES):
+    """Letterbox the fixture photos into frames and record them with their FaceMesh landmarks."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frames = (photo_frame(os.path.join(face_service.assets_dir, photo), *FIXTURE_SIZE) for photo in fixture_photos())
+    record_frames(frames, path, static=True, source="fixture photos")
+
+
+def load_fixtures(path=FIXTURES):
+    if not os.path.exists(path):
+        record_fixtures(path)
+    return LandmarkFixture(path)
+
+
+def fixture_faces(fixture):
+    """(478, 2) landmarks in fixture pixels, of the first face of every frame that has one."""
+    size = np.array(fixture.size, dtype=np.float32)
+    return [faces[0][:, :2] * size for faces in map(fixture.face_landmarks, range(len(fixture))) if faces]
+
+
+def place_face(lm, frame_w, frame_h):
+    """Scale fixture landmarks to a centred face FACE_HEIGHT of the frame tall."""
+    pts = lm.astype(np.float32)
+    pts -= pts.min(axis=0)
+    pts /= max(pts[:, 1].max(), 1e-6)
+    pts *= FACE_HEIGHT * frame_h
+    pts += (np.array([frame_w, frame_h]) - pts.max(axis=0)) / 2
+    return pts.astype(np.int32)
+
+
+def photo_frame(photo_path, frame_w, frame_h):
+    """A fixture photo letterboxed into a frame of the given size (input for process_frame)."""
+    img = cv2.imread(photo_path)
+    scale = min(frame_w / img.shape[1], frame_h / img.shape[0])
+    img = cv2.resize(img, (int(img.shape[1] * scale), int(img.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+    frame = np.zeros((frame_h, frame_w, 3), dtype=np.uint8)
+    y, x = (frame_h - img.shape[0]) // 2, (frame_w - img.shape[1]) // 2
+    frame[y:y+img.shape[0], x:x+img.shape[1]] = img
+    return frame
+
+
+def resized_asset(asset, longest):
+    """Copy of a warp asset with its image (and landmarks) scaled to the given longest side."""
+    if not longest:
+        return asset
+    h, w = asset["img"].shape[:2]
+    scale = longest / max(h, w)
+    scaled = dict(asset)
+    scaled["img"] = cv2.resize(asset["img"], (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    sh, sw = scaled["img"].shape[:2]
+    scaled["lm"] = np.minimum((asset["lm"] * scale).astype(np.int32), [sw - 1, sh - 1])
+    return scaled
+
+
+# -----------------------------
+# TIMING
+# -----------------------------
+def timeit(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000.0)
+    times = np.array(times)
+    return {
+        "mean_ms": round(float(times.mean()), 3),
+        "p50_ms": round(float(np.percentile(times, 50)), 3),
+        "p95_ms": round(float(np.percentile(times, 95)), 3),
+        "min_ms": round(float(times.min()), 3),
+        "repeat": repeat,
+    }
+
+
+def assets_of(kind):
+    """Assets of a type in a stable order (ids depend on directory listing order)."""
+    found = [(folder, a) for folder, assets in face_service.categories.items() for a in assets
+             if a.get("type", "mask") == kind]
+    return [a for _, a in sorted(found, key=lambda fa: (fa[0], fa[1]["name"]))]
+
+
+def first_asset(kind):
+    found = assets_of(kind)
+    return found[0] if found else None
+
+
+def bench_delaunay(fixture, repeat):
+    landmarks = fixture_faces(fixture)
+    w, h = FRAME_SIZES["720p"]
+    pts = place_face(landmarks[0], w, h)
+    full = np.vstack((pts, face_service.get_user_boundary_points(pts, w, h)))
+    yield "delaunay", timeit(lambda: face_service.calculate_delaunay(full), repeat)
+
+
+def bench_warp(fixture, repeat):
+    landmarks = fixture_faces(fixture)
+    asset = first_asset("mask")
+    for size_name, (w, h) in FRAME_SIZES.items():
+        frame = np.full((h, w, 3), 127, dtype=np.uint8)
+        pts = place_face(landmarks[0], w, h)
+        for longest in ASSET_SIZES:
+            scaled = resized_asset(asset, longest)
+            for opacity in OPACITIES:
+                name = f"warp/{size_name}/asset{longest or 'native'}/op{opacity}"
+                yield name, timeit(lambda: face_service.warp_face_transparent(frame, scaled, pts, opacity), repeat)
+
+
+def bench_overlay(fixture, repeat):
+    landmarks = fixture_faces(fixture)
+    overlays = assets_of("overlay")
+    for size_name, (w, h) in FRAME_SIZES.items():
+        frame = np.full((h, w, 3), 127, dtype=np.uint8)
+        pts = place_face(landmarks[0], w, h)
+        for asset in overlays:
+            for opacity in OPACITIES:
+                name = f"overlay/{size_name}/{asset['folder']}_{os.path.splitext(asset['name'])[0]}/op{opacity}"
+                yield name, timeit(lambda: face_service.apply_overlay(frame.copy(), asset, pts, opacity), repeat)
+
+
+def bench_process_asset(fixture, repeat):
+    for name in fixture_photos()[:3]:
+        path = os.path.join(face_service.assets_dir, name)
+        yield f"process_asset/{name}", timeit(lambda: face_service._process_asset(path, "bench"),
+                                              max(1, repeat // 10), warmup=1)
+
+
+def bench_process_frame(fixture, repeat):
+    asset = first_asset("mask")
+    # Replayed FaceMesh results come from the fixture, so the frames must be its own, in order;
+    # with --live-mesh FaceMesh runs on the same frames
+    replay = face_service.replay_fixture
+    source = replay if replay is not None else fixture
+    n = min(len(source), 60)
+    for size_name, (w, h) in FRAME_SIZES.items():
+        # Landmarks are normalized, so they still fit the frames after the resize
+        frames = [cv2.resize(source.frame(i), (w, h)) for i in range(n)]
+        frames_b64 = [base64.b64encode(cv2.imencode('.jpg', f)[1]).decode('utf-8') for f in frames]
+        count = 0
+
+        def run_frame(opacity):
+            nonlocal count
+            i = count % n
+            count += 1
+            if replay is not None and i == 0:
+                face_service.face_mesh.reset()  # keep replayed landmarks in step with the frames
+            face_service.process_frame(frames_b64[i], asset["id"], opacity, "bench")
+
+        for opacity in OPACITIES:
+            yield f"process_frame/{size_name}/op{opacity}", timeit(lambda: run_frame(opacity), repeat)
+
+BENCHMARKS = {
+    "delaunay": bench_delaunay,
+    "warp": bench_warp,
+    "overlay": bench_overlay,
+    "process_asset": bench_process_asset,
+    "process_frame": bench_process_frame,
+}
+
+
+# -----------------------------
+# BASELINE
+# -----------------------------
+def compare(results, baseline, tolerance):
+    """Print p50 deltas against the baseline; returns the names of regressed cases."""
+    regressions = []
+    print(f"\n{'case':<48} {'base p50':>10} {'p50':>10} {'delta':>8}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        delta = r["p50_ms"] / max(base["p50_ms"], 1e-6) - 1.0
+        flag = ""
+        if delta > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<48} {base['p50_ms']:>10} {r['p50_ms']:>10} {delta*100:>7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FaceService micro-benchmarks")
+    parser.add_argument("--only", help=f"Comma-separated subset of {','.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--quick", action="store_true", help="Few repetitions (smoke run)")
+    parser.add_argument("--threads", type=int, default=0, help="cv2 thread count (0 = OpenCV default)")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Compare against a stored results file")
+    parser.add_argument("--save-baseline", help="Write results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown (0.2 = +20%%)")
+    parser.add_argument("--record-fixtures", action="store_true", help="Re-record the landmark fixtures")
+    parser.add_argument("--replay", help="Video fixture from landmark_fixtures.py for process_frame "
+                                         "(default: the landmark fixture)")
+    parser.add_argument("--live-mesh", action="store_true",
+                        help="Run the real FaceMesh in process_frame instead of replaying landmarks")
+    args = parser.parse_args()
+
+    if args.threads:
+        cv2.setNumThreads(args.threads)
+    if args.record_fixtures:
+        record_fixtures()
+    repeat = 3 if args.quick else args.repeat
+    fixture = load_fixtures()
+    if not args.live_mesh:
+        face_service.enable_replay(args.replay or fixture.path)
+
+    results = {}
+    for group in (args.only.split(",") if args.only else BENCHMARKS):
+        for name, r in BENCHMARKS[group](fixture, repeat):
+            results[name] = r
+            print(f"{name:<48} p50 {r['p50_ms']:>9} ms  p95 {r['p95_ms']:>9} ms")
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "threads": cv2.getNumThreads(),
+            "landmarks": os.path.basename(face_service.replay_fixture.path) if face_service.replay_fixture else "live",
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than baseline by more than {args.tolerance*100:.0f}%")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Golden-image regression harness for the warp, overlay and asset mask paths.
+
+A fixed set of cases (mask assets warped onto the landmark fixtures, every
+overlay asset, and the alpha masks _process_asset builds) is rendered by one
+or more engines and compared with the reference PNGs in golden/:
+
+  - PSNR and SSIM must stay above --min-psnr / --min-ssim
+  - on failure, <case>_<engine>_diff.png (golden | output | amplified diff)
+    is written to --diff-dir
+  - every engine is timed per case, side by side
+
+Engines are alternative implementations of the same operations; "current"
+is FaceService as it is, "reference" the original full-frame warp. A new
+fast path is adopted by adding it to ENGINES and checking it passes.
+
+Usage:
+    python benchmarks/golden.py                         # check "current" against the goldens
+    python benchmarks/golden.py --engines current,reference --json golden.json
+    python benchmarks/golden.py --update                # re-render goldens with "current"
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from bench_face_service import face_service, fixture_faces, load_fixtures, place_face
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+FRAME_SIZE = (640, 480)
+OPACITY = 0.8
+WARP_ASSETS = 2      # first mask asset of the first N categories
+WARP_FIXTURES = 2    # first N landmark fixtures
+MASK_PHOTOS = ["Celebs/China.jpg", "Animals/cat.jpg"]
+
+
+def background(w, h):
+    """Deterministic smooth background, so blending errors are visible but PNGs stay small."""
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    return np.dstack([np.broadcast_to(x, (h, w)), np.broadcast_to(y, (h, w)),
+                      np.broadcast_to((x + y) / 2, (h, w))]).astype(np.uint8)
+
+
+def reference_warp(frame, asset, user_lm, opacity=1.0):
+    """The original full-frame warp_face_transparent: per-triangle warp into a frame-sized RGBA buffer."""
+    frame_h, frame_w = frame.shape[:2]
+    src_img, src_pts, tris = asset["img"], asset["lm"], asset["tri"]
+    user_pts = np.vstack((user_lm, face_service.get_user_boundary_points(user_lm, frame_w, frame_h)))
+    warped_rgba = np.zeros((frame_h, frame_w, 4), dtype=np.uint8)
+
+    for tri in tris:
+        ps = [src_pts[i] for i in tri]
+        pt = [user_pts[i] for i in tri]
+        r1, r2 = cv2.boundingRect(np.float32(ps)), cv2.boundingRect(np.float32(pt))
+        if r1[2] <= 0 or r1[3] <= 0 or r2[2] <= 0 or r2[3] <= 0:
+            continue
+        ts = [(p[0]-r1[0], p[1]-r1[1]) for p in ps]
+        tt = [(p[0]-r2[0], p[1]-r2[1]) for p in pt]
+        mask = np.zeros((r2[3], r2[2]), dtype=np.uint8)
+        cv2.fillConvexPoly(mask, np.int32(tt), 255)
+        img1 = src_img[r1[1]:r1[1]+r1[3], r1[0]:r1[0]+r1[2]]
+        mat = cv2.getAffineTransform(np.float32(ts), np.float32(tt))
+        img2 = cv2.warpAffine(img1, mat, (r2[2], r2[3]), None, flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0, 0))
+        y1, y2, x1, x2 = r2[1], r2[1]+r2[3], r2[0], r2[0]+r2[2]
+        if y1 < 0 or x1 < 0 or y2 > frame_h or x2 > frame_w:
+            continue
+        target = warped_rgba[y1:y2, x1:x2]
+        target[mask > 0] = img2[mask > 0]
+
+    a3 = np.dstack([(warped_rgba[:, :, 3] / 255.0) * opacity] * 3)
+    return (warped_rgba[:, :, :3].astype(np.float32) * a3 + frame.astype(np.float32) * (1.0 - a3)).astype(np.uint8)
+
+
+# Engine name -> operation -> implementation; an engine only runs the operations it defines
+ENGINES = {
+    "current": {
+        "warp": face_service.warp_face_transparent,
+        "overlay": lambda frame, asset, pts, opacity: face_service.apply_overlay(frame.copy(), asset, pts, opacity),
+        "mask": lambda path: face_service._process_asset(path, "golden")["img"][:, :, 3],
+    },
+    "reference": {
+        "warp": reference_warp,
+    },
+}
+
+
+def build_cases():
+    """(name, operation, args) for every golden case."""
+    landmarks = fixture_faces(load_fixtures())
+    w, h = FRAME_SIZE
+    frame = background(w, h)
+    cases = []
+
+    # Asset ids depend on directory listing order, so cases are keyed by folder and file name
+    by_name = sorted(((folder, a) for folder, assets in face_service.categories.items() for a in assets),
+                     key=lambda fa: (fa[0], fa[1]["name"]))
+    key = lambda folder, asset: f"{folder}_{os.path.splitext(asset['name'])[0]}"
+
+    masks = {}
+    for folder, asset in by_name:
+        if asset.get("type", "mask") == "mask":
+            masks.setdefault(folder, asset)
+    for folder, asset in list(masks.items())[:WARP_ASSETS]:
+        for f in range(min(WARP_FIXTURES, len(landmarks))):
+            pts = place_face(landmarks[f], w, h)
+            cases.append((f"warp_{key(folder, asset)}_face{f}", "warp", (frame, asset, pts, OPACITY)))
+
+    overlays = [(f, a) for f, a in by_name if a.get("type") == "overlay"]
+    pts = place_face(landmarks[0], w, h)
+    for folder, asset in overlays:
+        cases.append((f"overlay_{key(folder, asset)}", "overlay", (frame, asset, pts, OPACITY)))
+
+    for photo in MASK_PHOTOS:
+        path = os.path.join(face_service.assets_dir, photo)
+        if os.path.exists(path):
+            name = os.path.splitext(photo.replace("/", "_"))[0]
+            cases.append((f"mask_{name}", "mask", (path,)))
+    return cases
+
+
+# -----------------------------
+# COMPARISON
+# -----------------------------
+def ssim(a, b):
+    """Mean SSIM (Wang et al. 2004, 11x11 Gaussian window) over all channels."""
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    a = a.astype(np.float64)
+    b = b.astype(np.float64)
+    blur = lambda x: cv2.GaussianBlur(x, (11, 11), 1.5)
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a ** 2
+    var_b = blur(b * b) - mu_b ** 2
+    cov = blur(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+
+def write_diff(path, golden, output):
+    diff = cv2.absdiff(golden, output)
+    diff = cv2.convertScaleAbs(diff, alpha=8)  # small errors become visible
+    to_bgr = lambda x: cv2.cvtColor(x, cv2.COLOR_GRAY2BGR) if x.ndim == 2 else x
+    cv2.imwrite(path, np.hstack([to_bgr(golden), to_bgr(output), to_bgr(diff)]))
+
+
+def timed(fn, args, repeat):
+    fn(*args)  # warm-up
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn(*args)
+        times.append((time.perf_counter() - t) * 1000.0)
+    return out, float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Golden-image regression checks for warp / overlay / asset masks")
+    parser.add_argument("--engines", default="current", help=f"Comma-separated subset of {','.join(ENGINES)}")
+    parser.add_argument("--update", action="store_true", help="Re-render the goldens with the first engine")
+    parser.add_argument("--min-psnr", type=float, default=40.0)
+    parser.add_argument("--min-ssim", type=float, default=0.99)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case and engine")
+    parser.add_argument("--diff-dir", default=os.path.join(GOLDEN_DIR, "diff"))
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    engines = args.engines.split(",")
+    cases = build_cases()
+
+    if args.update:
+        engine = ENGINES[engines[0]]
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+        for name, op, op_args in cases:
+            cv2.imwrite(os.path.join(GOLDEN_DIR, name + ".png"), engine[op](*op_args),
+                        [cv2.IMWRITE_PNG_COMPRESSION, 9])
+        print(f"Wrote {len(cases)} goldens to {GOLDEN_DIR} with engine '{engines[0]}'")
+        return
+
+    report = []
+    failures = 0
+    header = f"{'case':<36}" + "".join(f" {e + ' ms':>14} {'psnr':>7} {'ssim':>7}" for e in engines)
+    print(header)
+    print("-" * len(header))
+    for name, op, op_args in cases:
+        golden = cv2.imread(os.path.join(GOLDEN_DIR, name + ".png"), cv2.IMREAD_UNCHANGED)
+        row = f"{name:<36}"
+        for engine_name in engines:
+            fn = ENGINES[engine_name].get(op)
+            if fn is None:
+                row += f" {'-':>14} {'':>7} {'':>7}"
+                continue
+            output, ms = timed(fn, op_args, args.repeat)
+            entry = {"case": name, "engine": engine_name, "ms": round(ms, 3)}
+            if golden is None:
+                entry.update(passed=False, error="missing golden")
+            elif golden.shape != output.shape:
+                entry.update(passed=False, error=f"shape {output.shape} != golden {golden.shape}")
+            else:
+                entry.update(psnr=round(psnr(golden, output), 2), ssim=round(ssim(golden, output), 5))
+                entry["passed"] = entry["psnr"] >= args.min_psnr and entry["ssim"] >= args.min_ssim
+            if not entry["passed"]:
+                failures += 1
+                if golden is not None and golden.shape == output.shape:
+                    os.makedirs(args.diff_dir, exist_ok=True)
+                    write_diff(os.path.join(args.diff_dir, f"{name}_{engine_name}_diff.png"), golden, output)
+            report.append(entry)
+            mark = "" if entry["passed"] else " FAIL"
+            row += f" {ms:>14.2f} {entry.get('psnr', '-'):>7} {entry.get('ssim', '-'):>7}{mark}"
+        print(row)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+    if failures:
+        print(f"\n{failures} check(s) below PSNR {args.min_psnr} / SSIM {args.min_ssim}; diffs in {args.diff_dir}")
+        sys.exit(1)
+    print("\nAll outputs match the goldens")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Load generator for the Morphy API.
+
+Starts backend/main.py under uvicorn (or targets --url), then runs N clients
+that each replay a recorded frame sequence at a target FPS, the way the app
+streams its camera: one request in flight per client, frames that are late
+by more than one frame interval are dropped (and counted) instead of queued.
+
+Per client:
+  - POST /process-frame for every frame it keeps up with
+  - POST /detect-gender every --gender-every frames
+  - with --record, /start-recording before and /stop-recording plus the
+    download of its video_url (/recordings/{token}) after the run
+
+Frames come from a landmark fixture (backend/landmark_fixtures.py), a video
+file, or by default the Celebs asset photos.
+
+Usage:
+    python benchmarks/load_test.py --clients 8 --fps 15 --duration 30
+    python benchmarks/load_test.py --fixture benchmarks/fixtures/clip.npz --workers 4 --record --json load.json
+    python benchmarks/load_test.py --url http://10.0.0.5:8000 --clients 32
+"""
+import argparse
+import base64
+import glob
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+import cv2
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BACKEND_DIR = os.path.join(ROOT, "backend")
+
+
+# -----------------------------
+# FRAMES
+# -----------------------------
+def load_frames(fixture=None, video=None, width=640, limit=60):
+    """JPEG/base64 frames to replay, resized to the given width."""
+    frames = []
+    if fixture:
+        sys.path.append(BACKEND_DIR)
+        from landmark_fixtures import LandmarkFixture
+        fx = LandmarkFixture(fixture)
+        frames = [fx.frame(i) for i in range(min(len(fx), limit))]
+    elif video:
+        cap = cv2.VideoCapture(video)
+        while len(frames) < limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    else:
+        for path in sorted(glob.glob(os.path.join(ROOT, "UI", "assets", "Celebs", "*.jpg"))):
+            img = cv2.imread(path)
+            if img is not None:
+                frames.append(img)
+
+    out = []
+    for frame in frames:
+        height = int(round(frame.shape[0] * width / frame.shape[1])) // 2 * 2
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        out.append(base64.b64encode(cv2.imencode('.jpg', frame)[1]).decode('utf-8'))
+    return out
+
+
+# -----------------------------
+# SERVER
+# -----------------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, env_overrides, timeout=180.0):
+    port = free_port()
+    env = dict(os.environ, **env_overrides)
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("Server did not start in time")
+
+
+# -----------------------------
+# CLIENTS
+# -----------------------------
+class Client(threading.Thread):
+    def __init__(self, index, url, frames, args, start_at):
+        super().__init__(name=f"client-{index}", daemon=True)
+        parsed = urllib.parse.urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.session_id = f"load-{index}"
+        self.frames = frames
+        self.args = args
+        self.start_at = start_at
+        self.offset = index * len(frames) // max(args.clients, 1)  # clients don't send identical frames
+        self.latencies = {}  # endpoint -> [ms]
+        self.errors = {}     # endpoint -> count
+        self.sent = 0
+        self.dropped = 0
+        self.conn = None
+
+    def _request(self, method, path, body=None):
+        """Send one request on the keep-alive connection; returns (ok, parsed json or bytes)."""
+        endpoint = path.split("?")[0].rsplit("/", 1)[0] if path.startswith("/recordings/") else path
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        t = time.perf_counter()
+        ok, data = False, None
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.args.timeout)
+            self.conn.request(method, path, body=payload, headers=headers)
+            resp = self.conn.getresponse()
+            raw = resp.read()
+            data = json.loads(raw) if resp.getheader("Content-Type", "").startswith("application/json") else raw
+            ok = resp.status < 400
+            if isinstance(data, dict):
+                ok = ok and data.get("success", True) and not data.get("error")
+        except (OSError, http.client.HTTPException, ValueError):
+            self.conn = None
+        self.latencies.setdefault(endpoint, []).append((time.perf_counter() - t) * 1000.0)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        return ok, data
+
+    def run(self):
+        args = self.args
+        if args.record:
+            self._request("POST", "/start-recording", {"fps": int(args.fps), "session_id": self.session_id})
+
+        interval = 1.0 / args.fps
+        end_at = self.start_at + args.duration
+        while time.time() < self.start_at:
+            time.sleep(0.005)
+
+        i = 0
+        next_at = self.start_at
+        while True:
+            now = time.time()
+            if now >= end_at:
+                break
+            if now < next_at:
+                time.sleep(next_at - now)
+            elif now - next_at > interval:
+                # Camera frames are not queued while a request is in flight
+                skipped = int((now - next_at) / interval)
+                self.dropped += skipped
+                i += skipped
+                next_at += skipped * interval
+                continue
+
+            frame_b64 = self.frames[(self.offset + i) % len(self.frames)]
+            self._request("POST", "/process-frame", {"frame": frame_b64, "asset_id": args.asset_id,
+                                                     "opacity": args.opacity, "session_id": self.session_id})
+            if args.gender_every and i % args.gender_every == 0:
+                self._request("POST", "/detect-gender", {"frame": frame_b64, "session_id": self.session_id})
+            self.sent += 1
+            i += 1
+            next_at += interval
+
+        if args.record:
+            ok, info = self._request("POST", "/stop-recording", {"session_id": self.session_id})
+            if ok and isinstance(info, dict) and info.get("video_url"):
+                self._request("GET", info["video_url"])
+
+
+# -----------------------------
+# REPORT
+# -----------------------------
+def summarize(clients, elapsed):
+    endpoints = {}
+    for c in clients:
+        for name, values in c.latencies.items():
+            endpoints.setdefault(name, []).extend(values)
+
+    report = {"endpoints": {}}
+    for name, values in sorted(endpoints.items()):
+        values = np.array(values)
+        errors = sum(c.errors.get(name, 0) for c in clients)
+        report["endpoints"][name] = {
+            "requests": int(len(values)),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(float(np.percentile(values, 50)), 2),
+            "p95_ms": round(float(np.percentile(values, 95)), 2),
+            "p99_ms": round(float(np.percentile(values, 99)), 2),
+            "errors": errors,
+            "error_rate": round(errors / len(values), 4),
+        }
+    sent = sum(c.sent for c in clients)
+    dropped = sum(c.dropped for c in clients)
+    report["frames"] = {
+        "sent": sent,
+        "dropped": dropped,
+        "drop_rate": round(dropped / max(sent + dropped, 1), 4),
+        "achieved_fps_per_client": round(sent / elapsed / max(len(clients), 1), 2),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay camera sessions against the Morphy API")
+    parser.add_argument("--url", help="Target an already running server instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local server")
+    parser.add_argument("--server-env", action="append", default=[],
+                        help="KEY=VALUE for the local server (repeatable), e.g. LANDMARK_REPLAY=...")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--fps", type=float, default=15.0, help="Target frames per second per client")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per client")
+    parser.add_argument("--ramp", type=float, default=2.0, help="Seconds over which clients start")
+    parser.add_argument("--fixture", help="Landmark fixture .npz whose frames are replayed")
+    parser.add_argument("--video", help="Video file whose frames are replayed")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--asset-id", default="Celebs_0")
+    parser.add_argument("--opacity", type=float, default=1.0)
+    parser.add_argument("--gender-every", type=int, default=15, help="detect-gender every N frames (0 = never)")
+    parser.add_argument("--record", action="store_true", help="Record and download a video per client")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout (s)")
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    frames = load_frames(args.fixture, args.video, args.width)
+    if not frames:
+        parser.error("no frames to replay")
+
+    proc = None
+    url = args.url
+    if url is None:
+        env = dict(kv.split("=", 1) for kv in args.server_env)
+        print(f"Starting server ({args.workers} worker(s))...")
+        proc, url = start_server(args.workers, env)
+    try:
+        print(f"{args.clients} clients x {args.fps} FPS for {args.duration}s against {url} "
+              f"({len(frames)} frames of width {args.width})")
+        start_at = time.time() + 0.5
+        clients = [Client(i, url, frames, args, start_at + args.ramp * i / max(args.clients, 1))
+                   for i in range(args.clients)]
+        for c in clients:
+            c.start()
+        for c in clients:
+            c.join()
+        elapsed = args.duration + args.ramp
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    report = summarize(clients, elapsed)
+    report["config"] = {k: v for k, v in vars(args).items() if k != "json"}
+
+    print(f"\n{'endpoint':<20} {'req':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err %':>7}")
+    for name, r in report["endpoints"].items():
+        print(f"{name:<20} {r['requests']:>7} {r['throughput_rps']:>8} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+              f"{r['p99_ms']:>9} {r['error_rate']*100:>6.1f}%")
+    f = report["frames"]
+    print(f"\nframes sent {f['sent']}, dropped {f['dropped']} ({f['drop_rate']*100:.1f}%), "
+          f"{f['achieved_fps_per_client']} FPS per client")
+
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(report, fp, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
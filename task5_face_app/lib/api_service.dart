@@ -34,9 +34,21 @@ class FilterAsset {
   }
 }
 
+/// A finished recording downloaded from the backend
+class RecordedVideo {
+  final Uint8List bytes;
+  final String filename;
+
+  RecordedVideo({required this.bytes, required this.filename});
+}
+
 class ApiService {
   static String _baseUrl = "http://127.0.0.1:8000";
 
+  /// Identifies this client so the backend keeps its recording separate
+  static final String sessionId =
+      DateTime.now().microsecondsSinceEpoch.toRadixString(36);
+
   static String get baseUrl {
     if (kIsWeb) return "http://127.0.0.1:8000";
     // If user has set a custom IP (e.g. for Android tablet), use it.
@@ -120,6 +132,7 @@ class ApiService {
           "frame": frameBase64,
           "asset_id": assetId,
           "opacity": opacity,
+          "session_id": sessionId,
         }),
       );
 
@@ -158,6 +171,7 @@ class ApiService {
         headers: {"Content-Type": "application/json"},
         body: jsonEncode({
           "frame": frameBase64,
+          "session_id": sessionId,
         }),
       );
 
@@ -178,9 +192,9 @@ class ApiService {
         Uri.parse("$baseUrl/start-recording"),
         headers: {"Content-Type": "application/json"},
         body: jsonEncode({
-          "width": 640, // Values ignored by backend in lazy mode
-          "height": 480,
-          "fps": 20
+          // No width/height: backend keeps the camera frame size
+          "fps": 20,
+          "session_id": sessionId,
         }),
       );
       if (response.statusCode == 200) {
@@ -193,17 +207,25 @@ class ApiService {
     }
   }
 
-  /// Stop recording and get video
-  static Future<String?> stopRecording() async {
+  /// Stop recording and download the video
+  static Future<RecordedVideo?> stopRecording() async {
     try {
       final response = await http.post(
         Uri.parse("$baseUrl/stop-recording"),
+        headers: {"Content-Type": "application/json"},
+        body: jsonEncode({"session_id": sessionId}),
       );
 
       if (response.statusCode == 200) {
         final data = jsonDecode(response.body);
-        if (data['success'] == true && data['video'] != null) {
-          return data['video'];
+        if (data['success'] == true && data['video_url'] != null) {
+          final video = await http.get(Uri.parse("$baseUrl${data['video_url']}"));
+          if (video.statusCode == 200) {
+            return RecordedVideo(
+              bytes: video.bodyBytes,
+              filename: data['filename'] ?? "morphy_video.avi",
+            );
+          }
         }
       }
       return null;
@@ -1174,15 +1174,15 @@ class _MorphCameraScreenState extends State<MorphCameraScreen> {
       if (_isVideoMode) {
         if (_isRecording) {
           // STOP RECORDING
-          final videoBase64 = await ApiService.stopRecording();
+          final video = await ApiService.stopRecording();
           setState(() => _isRecording = false);
           _stopStreaming(); // Stop stream after recording to save resources? Or keep it? keeping it is better UX.
 
-          if (videoBase64 != null) {
-            final bytes = ApiService.base64ToBytes(videoBase64);
+          if (video != null) {
+            final bytes = video.bytes;
 
             if (kIsWeb) {
-              _downloadOnWeb(bytes, "morphy_video.avi");
+              _downloadOnWeb(bytes, video.filename);
               if (mounted) {
                 ScaffoldMessenger.of(context).showSnackBar(const SnackBar(
                     content: Text("Video Downloaded!"),
@@ -1191,7 +1191,7 @@ class _MorphCameraScreenState extends State<MorphCameraScreen> {
             } else {
               // MOBILE / DESKTOP
               final directory = await Directory.systemTemp.createTemp();
-              final file = File('${directory.path}/morphy_video.avi');
+              final file = File('${directory.path}/${video.filename}');
               await file.writeAsBytes(bytes);
               await _saveVideoToGallery(file.path);
             }
@@ -0,0 +1,169 @@
+"""
+Compare gender backends (Caffe gender_net, ONNX and TFLite exports of the
+MobileNetV2 model) on a local labelled folder of face crops.
+
+Labels come from either
+  - subfolders named Male/Female (or man/woman, 0/1),
+  - UTKFace-style file names: <age>_<gender>_<race>_<date>.jpg (0 = male, 1 = female), or
+  - preprocessed shards from gender_shards.py (--shards, --fold, --split)
+
+Usage:
+    python benchmark_gender.py --data /path/to/faces --backends caffe,onnx,tflite --limit 1000
+    python benchmark_gender.py --shards shards/adience --fold test_fold_is_0 --split test
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from gender_backends import load_gender_backend
+from gender_shards import GenderShards
+
+FOLDER_LABELS = {"male": 0, "man": 0, "0": 0, "female": 1, "woman": 1, "1": 1}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def label_from_path(path):
+    folder = os.path.basename(os.path.dirname(path)).lower()
+    if folder in FOLDER_LABELS:
+        return FOLDER_LABELS[folder]
+    parts = os.path.basename(path).split("_")
+    if len(parts) >= 2 and parts[1] in ("0", "1"):
+        return int(parts[1])
+    return None
+
+
+def load_samples(data_dir, limit):
+    samples = []
+    for root, _, files in os.walk(data_dir):
+        for name in sorted(files):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            label = label_from_path(path)
+            if label is not None:
+                samples.append((path, label))
+    samples.sort()
+    if limit:
+        rng = np.random.default_rng(0)
+        idx = rng.permutation(len(samples))[:limit]
+        samples = [samples[i] for i in sorted(idx)]
+
+    images, labels = [], []
+    for path, label in samples:
+        img = cv2.imread(path)
+        if img is not None:
+            images.append(img)
+            labels.append(label)
+    return images, np.array(labels, dtype=np.int32)
+
+
+def load_shard_samples(shards_dir, fold, split, limit):
+    shards = GenderShards(shards_dir)
+    rows = shards.split(fold or shards.folds()[0], split)
+    if limit:
+        rows = np.sort(np.random.default_rng(0).permutation(rows)[:limit])
+    images, labels = shards.read(rows)
+    return list(images), labels
+
+
+def benchmark(backend_name, model_path, images, labels, batch_size, warmup):
+    start = time.perf_counter()
+    backend = load_gender_backend(backend_name, model_path)
+    load_s = time.perf_counter() - start
+
+    for img in images[:warmup]:
+        backend.predict([img])
+
+    # Single-image latency (the per-request cost without batching)
+    latencies = []
+    preds = []
+    for img in images:
+        t = time.perf_counter()
+        probs = backend.predict([img])
+        latencies.append((time.perf_counter() - t) * 1000.0)
+        preds.append(int(probs[0].argmax()))
+    latencies = np.array(latencies)
+
+    # Batched throughput
+    t = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        backend.predict(images[i:i + batch_size])
+    batched_s = time.perf_counter() - t
+
+    accuracy = float(np.mean(np.array(preds) == labels)) if len(labels) else 0.0
+    return {
+        "backend": backend_name,
+        "input_size": backend.input_size,
+        "load_s": round(load_s, 3),
+        "latency_ms_mean": round(float(latencies.mean()), 3),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 3),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 3),
+        "throughput_single_ips": round(len(images) / (latencies.sum() / 1000.0), 1),
+        "throughput_batched_ips": round(len(images) / batched_s, 1),
+        "batch_size": batch_size,
+        "accuracy": round(accuracy, 4),
+        "samples": len(images),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gender backend latency/throughput/accuracy benchmark")
+    parser.add_argument("--data", help="Labelled face folder")
+    parser.add_argument("--shards", help="Shard directory from gender_shards.py (instead of --data)")
+    parser.add_argument("--fold", help="Shard fold (default: first fold)")
+    parser.add_argument("--split", default="val", help="Shard split")
+    parser.add_argument("--backends", default="caffe,onnx,tflite")
+    parser.add_argument("--model", action="append", default=[],
+                        help="Override a model path as backend=path (repeatable)")
+    parser.add_argument("--limit", type=int, default=0, help="Random subset size (0 = all)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=0, help="cv2 thread count (0 = OpenCV default)")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    if args.threads:
+        cv2.setNumThreads(args.threads)
+
+    model_paths = dict(m.split("=", 1) for m in args.model)
+    if args.shards:
+        images, labels = load_shard_samples(args.shards, args.fold, args.split, args.limit)
+    elif args.data:
+        images, labels = load_samples(args.data, args.limit)
+    else:
+        parser.error("one of --data or --shards is required")
+    if not images:
+        print(f"No labelled images found in {args.shards or args.data}")
+        return
+    print(f"Loaded {len(images)} images ({int((labels == 0).sum())} male, {int((labels == 1).sum())} female)")
+
+    results = []
+    for name in args.backends.split(","):
+        try:
+            result = benchmark(name, model_paths.get(name), images, labels, args.batch_size, args.warmup)
+        except Exception as e:
+            print(f"[{name}] skipped: {e}")
+            continue
+        results.append(result)
+
+    header = f"{'backend':<8} {'input':>5} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>8} {'batch img/s':>12} {'acc':>7}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['backend']:<8} {r['input_size']:>5} {r['latency_ms_p50']:>8} {r['latency_ms_p95']:>8} "
+              f"{r['throughput_single_ips']:>8} {r['throughput_batched_ips']:>12} {r['accuracy']:>7}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Export the Keras MobileNetV2 gender model (gender_model.keras from
+train_gender.py) for serving:
+
+  - gender_model.onnx   (NCHW input, loaded with cv2.dnn.readNetFromONNX)
+  - gender_model.tflite (optionally float16 / dynamic-range quantized)
+
+Usage:
+    python export_gender_model.py --model gender_model.keras --quantize float16
+"""
+import argparse
+import os
+
+import tensorflow as tf
+
+
+def export_onnx(model, out_path, img_size):
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None, img_size, img_size, 3), tf.float32, name="input"),)
+    # NCHW input so the server can feed cv2.dnn.blobFromImages directly
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13,
+                               inputs_as_nchw=["input"], output_path=out_path)
+    print(f"ONNX model saved as '{out_path}'")
+
+
+def export_tflite(model, out_path, quantize):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize in ("float16", "dynamic"):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+
+    with open(out_path, "wb") as f:
+        f.write(converter.convert())
+    print(f"TFLite model saved as '{out_path}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the Keras gender model to ONNX and TFLite")
+    parser.add_argument("--model", default="gender_model.keras")
+    parser.add_argument("--out-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--img-size", type=int, default=128)
+    parser.add_argument("--formats", default="onnx,tflite")
+    parser.add_argument("--quantize", choices=["none", "float16", "dynamic"], default="none")
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model)
+    formats = args.formats.split(",")
+
+    if "onnx" in formats:
+        export_onnx(model, os.path.join(args.out_dir, "gender_model.onnx"), args.img_size)
+    if "tflite" in formats:
+        export_tflite(model, os.path.join(args.out_dir, "gender_model.tflite"), args.quantize)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Preprocessed gender dataset shards.
+
+One-time preprocessing decodes and resizes every face once and writes:
+
+  <out>/images_00000.npy ...   uint8 (N, S, S, 3) BGR face crops, one row per unique image
+  <out>/labels.npy             int8 (total,) gender per row (0 = male, 1 = female)
+  <out>/splits/<fold>_<split>.npy   int64 row indices for every fold / split
+  <out>/manifest.json          image size, shard layout, folds/splits, split parameters and a source hash
+
+Training and evaluation scripts memory-map the shards with GenderShards,
+so repeated experiments skip JPEG decoding and stay uint8 until batching.
+A rebuild is written next to <out> and swapped in once complete.
+
+Usage:
+    python gender_shards.py utkface --data /path/to/UTKFace --out shards/utkface --img-size 128
+    python gender_shards.py adience --data /path/to/aligned \\
+        --folds AgeGenderDeepLearning-master/AgeGenderDeepLearning-master/Folds/train_val_txt_files_per_fold \\
+        --out shards/adience --img-size 227
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+MANIFEST_VERSION = 1
+UTK_NAME = re.compile(r"^\d+_[01]_.*\.jpg$")
+
+
+# -----------------------------
+# SOURCES
+# -----------------------------
+def utkface_files(data_dir):
+    """UTKFace image paths, sorted by name, and the gender label from each name."""
+    files = sorted(f for f in os.listdir(data_dir) if UTK_NAME.match(f))
+    paths = [os.path.join(data_dir, f) for f in files]
+    labels = np.array([int(f.split("_")[1]) for f in files], dtype=np.int8)
+    return paths, labels
+
+
+def stratified_split(labels, val_split=0.2, seed=42):
+    """
+    Sorted (train, val) row indices with val_split of every class in val.
+    train_gender.py splits its JPEG list with this too, so both input paths
+    validate on the same images.
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    train_idx, val_idx = [], []
+    for cls in np.unique(labels):
+        idx = rng.permutation(np.flatnonzero(labels == cls))
+        n_val = int(round(len(idx) * val_split))
+        val_idx.extend(idx[:n_val])
+        train_idx.extend(idx[n_val:])
+    return np.sort(np.array(train_idx, dtype=np.int64)), np.sort(np.array(val_idx, dtype=np.int64))
+
+
+def utkface_source(data_dir, val_split=0.2, seed=42):
+    """UTKFace: label from the file name, one stratified train/val split."""
+    paths, labels = utkface_files(data_dir)
+    train_idx, val_idx = stratified_split(labels, val_split, seed)
+    splits = {"utkface": {"train": train_idx, "val": val_idx}}
+    return paths, labels, splits, []
+
+
+def adience_source(data_dir, folds_dir):
+    """Adience: gender_{train,val,test}.txt lists from create_train_val_txt_files.py, per test fold."""
+    row_of = {}
+    paths, labels = [], []
+    splits = {}
+    list_files = []
+
+    for fold in sorted(os.listdir(folds_dir)):
+        fold_dir = os.path.join(folds_dir, fold)
+        if not os.path.isdir(fold_dir):
+            continue
+        for split in ("train", "val", "test"):
+            list_file = os.path.join(fold_dir, f"gender_{split}.txt")
+            if not os.path.exists(list_file):
+                continue
+            list_files.append(list_file)
+            rows = []
+            with open(list_file) as f:
+                for line in f:
+                    parts = line.strip().rsplit(" ", 1)
+                    if len(parts) != 2:
+                        continue
+                    rel_path, label = parts
+                    if rel_path not in row_of:
+                        row_of[rel_path] = len(paths)
+                        paths.append(os.path.join(data_dir, rel_path))
+                        labels.append(int(label))
+                    rows.append(row_of[rel_path])
+            splits.setdefault(fold, {})[split] = np.array(rows, dtype=np.int64)
+
+    return paths, np.array(labels, dtype=np.int8), splits, list_files
+
+
+def source_hash(paths, list_files, img_size, splits=None, shard_size=None, params=None):
+    """
+    Hash of source file names, sizes and mtimes, the split lists, the crop
+    size, the shard size and the computed split rows (so a different
+    --val-split or --seed is a rebuild too).
+    """
+    h = hashlib.sha1(f"v{MANIFEST_VERSION}:{img_size}:{shard_size}:{json.dumps(params or {}, sort_keys=True)}".encode())
+    for p in paths:
+        try:
+            st = os.stat(p)
+            h.update(f"{os.path.basename(p)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+        except OSError:
+            h.update(f"{os.path.basename(p)}:missing\n".encode())
+    for list_file in list_files:
+        with open(list_file, "rb") as f:
+            h.update(f.read())
+    for fold in sorted(splits or {}):
+        for split in sorted(splits[fold]):
+            h.update(f"{fold}/{split}:".encode())
+            h.update(np.asarray(splits[fold][split], dtype=np.int64).tobytes())
+    return h.hexdigest()
+
+
+# -----------------------------
+# WRITER
+# -----------------------------
+def _load_face(path, img_size):
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    return cv2.resize(img, (img_size, img_size), interpolation=cv2.INTER_AREA)
+
+
+def write_shards(out_dir, dataset, paths, labels, splits, list_files, img_size,
+                 shard_size=4096, workers=None, force=False, params=None):
+    """params: how the splits were made (e.g. val_split, seed); hashed and kept in the manifest."""
+    digest = source_hash(paths, list_files, img_size, splits, shard_size, params)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f).get("source_hash") == digest:
+                print(f"Shards in {out_dir} are up to date ({digest[:12]})")
+                return
+
+    # Built aside and swapped in whole, so a smaller rebuild leaves no stale shards behind
+    # and a failed one leaves the previous shards usable
+    out_dir = os.path.normpath(out_dir)
+    build_dir = out_dir + ".building"
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(os.path.join(build_dir, "splits"))
+    total = len(paths)
+    valid = np.ones(total, dtype=bool)
+    shards = []
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for shard_idx, start in enumerate(range(0, total, shard_size)):
+            end = min(start + shard_size, total)
+            name = f"images_{shard_idx:05d}.npy"
+            images = np.lib.format.open_memmap(os.path.join(build_dir, name), mode="w+", dtype=np.uint8,
+                                               shape=(end - start, img_size, img_size, 3))
+            for i, face in enumerate(pool.map(lambda p: _load_face(p, img_size), paths[start:end])):
+                if face is None:
+                    valid[start + i] = False
+                else:
+                    images[i] = face
+            images.flush()
+            del images
+            shards.append({"file": name, "start": start, "count": end - start})
+            print(f"Wrote {name} ({end}/{total})")
+
+    np.save(os.path.join(build_dir, "labels.npy"), labels)
+
+    # Unreadable images stay in the shards (as zeros) but are dropped from every split
+    split_meta = {}
+    for fold, fold_splits in splits.items():
+        for split, rows in fold_splits.items():
+            rows = np.asarray(rows, dtype=np.int64)
+            rows = rows[valid[rows]]
+            name = f"splits/{fold}_{split}.npy"
+            np.save(os.path.join(build_dir, name), rows)
+            split_meta.setdefault(fold, {})[split] = {"file": name, "count": int(len(rows))}
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "dataset": dataset,
+        "img_size": img_size,
+        "color": "BGR",
+        "dtype": "uint8",
+        "total": total,
+        "skipped": int((~valid).sum()),
+        "source_hash": digest,
+        "shard_size": shard_size,
+        "split_params": params or {},
+        "shards": shards,
+        "labels": "labels.npy",
+        "folds": split_meta,
+    }
+    with open(os.path.join(build_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Readers still mapping the old shards keep them until they close (POSIX)
+    old_dir = out_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(build_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    print(f"Manifest written to {manifest_path} ({total} images, {manifest['skipped']} unreadable)")
+
+
+# -----------------------------
+# READER
+# -----------------------------
+class GenderShards:
+    """Memory-mapped, read-only view of a shard directory written by write_shards."""
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.img_size = self.manifest["img_size"]
+        self.shards = [np.load(os.path.join(root, s["file"]), mmap_mode="r") for s in self.manifest["shards"]]
+        self.starts = np.array([s["start"] for s in self.manifest["shards"]], dtype=np.int64)
+        self.labels = np.load(os.path.join(root, self.manifest["labels"]), mmap_mode="r")
+
+    def folds(self):
+        return list(self.manifest["folds"])
+
+    def split(self, fold, split):
+        """Row indices of a fold's split (e.g. fold 'test_fold_is_0', split 'train')."""
+        meta = self.manifest["folds"][fold][split]
+        return np.load(os.path.join(self.root, meta["file"]))
+
+    def read(self, rows):
+        """Gather rows into (images uint8 BGR, labels); touches only the pages it needs."""
+        rows = np.asarray(rows, dtype=np.int64)
+        images = np.empty((len(rows), self.img_size, self.img_size, 3), dtype=np.uint8)
+        shard_of = np.searchsorted(self.starts, rows, side="right") - 1
+        for shard_idx in np.unique(shard_of):
+            sel = np.flatnonzero(shard_of == shard_idx)
+            local = rows[sel] - self.starts[shard_idx]
+            order = np.argsort(local)
+            # Sorted access keeps reads sequential within the memory-mapped shard
+            images[sel[order]] = self.shards[shard_idx][local[order]]
+        return images, np.asarray(self.labels[rows], dtype=np.int32)
+
+    def batches(self, rows, batch_size, shuffle=False, seed=None):
+        """Yield (images, labels) batches over the given rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if shuffle:
+            rows = np.random.default_rng(seed).permutation(rows)
+        for start in range(0, len(rows), batch_size):
+            yield self.read(rows[start:start + batch_size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess gender datasets into memory-mappable uint8 shards")
+    sub = parser.add_subparsers(dest="dataset", required=True)
+
+    utk = sub.add_parser("utkface")
+    utk.add_argument("--data", required=True, help="UTKFace image folder")
+    utk.add_argument("--val-split", type=float, default=0.2)
+    utk.add_argument("--seed", type=int, default=42, help="Seed of the stratified train/val split")
+
+    adience = sub.add_parser("adience")
+    adience.add_argument("--data", required=True, help="Adience aligned faces root")
+    adience.add_argument("--folds", required=True, help="train_val_txt_files_per_fold directory")
+
+    for p in (utk, adience):
+        p.add_argument("--out", required=True)
+        p.add_argument("--img-size", type=int, default=128)
+        p.add_argument("--shard-size", type=int, default=4096)
+        p.add_argument("--workers", type=int, default=0)
+        p.add_argument("--force", action="store_true", help="Rebuild even if the source hash matches")
+
+    args = parser.parse_args()
+    if args.dataset == "utkface":
+        paths, labels, splits, list_files = utkface_source(args.data, args.val_split, args.seed)
+        params = {"val_split": args.val_split, "seed": args.seed}
+    else:
+        paths, labels, splits, list_files = adience_source(args.data, args.folds)
+        params = {}
+
+    print(f"{len(paths)} images, {len(splits)} fold(s)")
+    write_shards(args.out, args.dataset, paths, labels, splits, list_files, args.img_size,
+                 args.shard_size, args.workers or None, args.force, params)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,112 +1,318 @@
-import cv2
-import numpy as np
-import os
+"""
+Real-time gender detection, pipelined for throughput:
 
-# Paths to model files (relative to this script)
-GENDER_PROTO = "deploy.prototxt"
-GENDER_MODEL = "gender_net.caffemodel"
+  capture thread   reads frames from a camera or a video file
+  main loop        runs the Haar face detector every N frames and an
+                   optical-flow tracker on the frames in between
+  gender batcher   classifies each new track once (batched with other new
+                   tracks); the result is cached per track ID until the track is lost
+
+Video files are read without dropping frames, so the same clip gives
+comparable numbers across machines; --headless skips the window.
+
+Usage:
+    python realtime_test.py                                   # webcam, Caffe gender_net
+    python realtime_test.py --source clip.mp4 --headless --json result.json
+    python realtime_test.py --source 0 --detect-every 5 --backend onnx
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
 
-# Load face detector
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+import cv2
+import numpy as np
 
-# Load gender network using the official model
-net = cv2.dnn.readNetFromCaffe(GENDER_PROTO, GENDER_MODEL)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from gender_backends import load_gender_backend
+from gender_batcher import GenderBatcher
 
 # Labels
 GENDER_LIST = ['Male', 'Female']
 
-# Model parameters
-MODEL_MEAN_VALUES = (104, 117, 123)
-IMG_SIZE = 227
 
+# -----------------------------
+# CAPTURE
+# -----------------------------
+class FrameSource(threading.Thread):
+    """
+    Reads frames on its own thread. Cameras keep only the newest frame
+    (stale frames are dropped and counted); files block instead, so every
+    frame is processed.
+    """
+
+    def __init__(self, source, queue_size=8):
+        super().__init__(name="capture", daemon=True)
+        self.is_camera = str(source).isdigit()
+        self.cap = cv2.VideoCapture(int(source) if self.is_camera else source)
+        self.frames = queue.Queue(maxsize=1 if self.is_camera else queue_size)
+        self.dropped = 0
+        self._stopped = threading.Event()
+
+    def isOpened(self):
+        return self.cap.isOpened()
 
-def get_gender(face_roi):
+    def run(self):
+        while not self._stopped.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            if self.is_camera:
+                # Flip frame for selfie view
+                frame = cv2.flip(frame, 1)
+                try:
+                    self.frames.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+                self.frames.put(frame)
+            else:
+                self._put(frame)
+        self._put(None)
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self.frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read(self):
+        """Next frame, or None once the source is exhausted."""
+        return self.frames.get()
+
+    def stop(self):
+        self._stopped.set()
+        self.join(timeout=1.0)
+        self.cap.release()
+
+
+# -----------------------------
+# TRACKING
+# -----------------------------
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.points = None
+        self.future = None      # pending gender prediction
+        self.gender = None      # (label, confidence) once predicted
+
+
+class FaceTracker:
     """
-    Predict gender for a face ROI
-    Returns: gender label and confidence
+    Haar detections matched to existing tracks by IoU; between detections each
+    box follows the median Lucas-Kanade flow of corner features inside it.
+    A track is lost when a detection pass no longer sees it or too few of
+    its features survive.
     """
-    # Resize face to model input size
-    face_blob = cv2.resize(face_roi, (IMG_SIZE, IMG_SIZE))
-    
-    # Create blob with mean subtraction (critical for accurate predictions)
-    blob = cv2.dnn.blobFromImage(
-        face_blob,
-        scalefactor=1.0,
-        size=(IMG_SIZE, IMG_SIZE),
-        mean=MODEL_MEAN_VALUES,
-        swapRB=False,
-        crop=False
-    )
-    
-    # Set input and get prediction
-    net.setInput(blob)
-    predictions = net.forward()
-    
-    # Get gender prediction (2 outputs: [Male, Female])
-    gender_idx = np.argmax(predictions[0])
-    gender_confidence = predictions[0][gender_idx]
-    
-    return GENDER_LIST[gender_idx], gender_confidence
-
-
-# Open webcam
-cap = cv2.VideoCapture(0)
-
-if not cap.isOpened():
-    print("❌ Cannot open camera")
-    exit()
-
-print("✅ Camera started. Press 'q' to quit.")
-print("Using AgeGenderDeepLearning pre-trained models for accurate gender detection.")
-
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
-
-    # Flip frame for selfie view
-    frame = cv2.flip(frame, 1)
-    
-    # Convert to grayscale for face detection
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    
-    # Detect faces
-    faces = face_cascade.detectMultiScale(gray, 1.3, 5, minSize=(30, 30))
-    
-    if len(faces) > 0:
-        for (x, y, w, h) in faces:
-            # Extract face ROI
-            face_roi = frame[y:y+h, x:x+w]
-            
-            # Predict gender
-            gender, confidence = get_gender(face_roi)
-            
-            # Draw rectangle around face
-            color = (0, 255, 0)
-            cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
-            
-            # Draw gender and confidence
-            text = f"{gender} ({confidence*100:.1f}%)"
-            cv2.putText(frame, text, (x, y-10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.9,
-                        color, 2)
-    else:
+
+    def __init__(self, iou_threshold=0.3, min_points=6):
+        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.iou_threshold = iou_threshold
+        self.min_points = min_points
+        self.tracks = []
+        self.next_id = 1
+        self.lost = 0
+
+    def _seed_points(self, gray, track):
+        x, y, w, h = track.box
+        mask = np.zeros_like(gray)
+        mask[y:y+h, x:x+w] = 255
+        track.points = cv2.goodFeaturesToTrack(gray, maxCorners=40, qualityLevel=0.01, minDistance=5, mask=mask)
+
+    def detect(self, gray):
+        """Run the detector; returns the tracks that are new in this pass."""
+        faces = self.face_cascade.detectMultiScale(gray, 1.3, 5, minSize=(30, 30))
+        unmatched = list(self.tracks)
+        kept, new = [], []
+        for box in (tuple(int(v) for v in f) for f in faces):
+            best = max(unmatched, key=lambda t: iou(t.box, box), default=None)
+            if best is not None and iou(best.box, box) >= self.iou_threshold:
+                unmatched.remove(best)
+                best.box = box
+                kept.append(best)
+            else:
+                track = Track(self.next_id, box)
+                self.next_id += 1
+                kept.append(track)
+                new.append(track)
+        self.lost += len(unmatched)
+        self.tracks = kept
+        for track in self.tracks:
+            self._seed_points(gray, track)
+        return new
+
+    def track(self, prev_gray, gray):
+        """Move every track by the median optical flow of its features."""
+        h_img, w_img = gray.shape[:2]
+        alive = []
+        for track in self.tracks:
+            if track.points is None or len(track.points) < self.min_points:
+                self.lost += 1
+                continue
+            new_pts, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, track.points, None,
+                                                          winSize=(15, 15), maxLevel=2)
+            good = status.reshape(-1) == 1
+            if good.sum() < self.min_points:
+                self.lost += 1
+                continue
+            dx, dy = np.median(new_pts[good] - track.points[good], axis=0).reshape(2)
+            x, y, w, h = track.box
+            x = int(round(min(max(x + dx, 0), w_img - w)))
+            y = int(round(min(max(y + dy, 0), h_img - h)))
+            track.box = (x, y, w, h)
+            track.points = new_pts[good].reshape(-1, 1, 2)
+            alive.append(track)
+        self.tracks = alive
+
+
+# -----------------------------
+# PIPELINE
+# -----------------------------
+def draw(frame, tracks, fps):
+    for track in tracks:
+        x, y, w, h = track.box
+        color = (0, 255, 0)
+        cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+        if track.gender is not None:
+            gender, confidence = track.gender
+            text = f"#{track.id} {gender} ({confidence*100:.1f}%)"
+        else:
+            text = f"#{track.id} ..."
+        cv2.putText(frame, text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
+
+    if not tracks:
         # No face detected
-        cv2.putText(frame, "No face detected", (20, 40),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1,
-                    (0, 0, 255), 2)
-    
-    # Display instructions
-    cv2.putText(frame, "Press 'q' to quit", (20, frame.shape[0] - 20),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.7,
-                (255, 255, 255), 2)
-    
-    # Show frame
-    cv2.imshow("Gender Detection - AgeGenderDeepLearning", frame)
-    
-    # Exit on 'q' key
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+        cv2.putText(frame, "No face detected", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+
+    cv2.putText(frame, f"{fps:.1f} FPS | Press 'q' to quit", (20, frame.shape[0] - 20),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+
+def run(args):
+    backend = load_gender_backend(args.backend, args.model)
+    batcher = GenderBatcher(backend, max_batch=args.batch_size)
+    tracker = FaceTracker()
+
+    source = FrameSource(args.source)
+    if not source.isOpened():
+        print(f"❌ Cannot open {'camera' if source.is_camera else 'video'} {args.source}")
+        return None
+    source.start()
+    print(f"✅ Reading {args.source} with the {backend.name} gender backend. Press 'q' to quit.")
+
+    stage_ms = {"detect": 0.0, "track": 0.0, "gender": 0.0}
+    frames = detections = inferences = 0
+    prev_gray = None
+    fps = 0.0
+    start = last = time.perf_counter()
+
+    while True:
+        frame = source.read()
+        if frame is None or (args.max_frames and frames >= args.max_frames):
+            break
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        t = time.perf_counter()
+        if prev_gray is None or frames % args.detect_every == 0:
+            new_tracks = tracker.detect(gray)
+            detections += 1
+            stage_ms["detect"] += (time.perf_counter() - t) * 1000.0
+            # One batched prediction per new track; kept until the track is lost
+            for track in new_tracks:
+                x, y, w, h = track.box
+                track.future = batcher.submit(frame[y:y+h, x:x+w].copy())
+                inferences += 1
+        else:
+            tracker.track(prev_gray, gray)
+            stage_ms["track"] += (time.perf_counter() - t) * 1000.0
+        prev_gray = gray
+
+        t = time.perf_counter()
+        for track in tracker.tracks:
+            if track.future is not None and (track.future.done() or args.headless):
+                pred = track.future.result()
+                gender_idx = int(np.argmax(pred))
+                track.gender = (GENDER_LIST[gender_idx], float(pred[gender_idx]))
+                track.future = None
+        stage_ms["gender"] += (time.perf_counter() - t) * 1000.0
+
+        frames += 1
+        now = time.perf_counter()
+        fps = 0.9 * fps + 0.1 / max(now - last, 1e-6) if frames > 1 else 1.0 / max(now - last, 1e-6)
+        last = now
+
+        if not args.headless:
+            draw(frame, tracker.tracks, fps)
+            cv2.imshow("Gender Detection - AgeGenderDeepLearning", frame)
+            # Exit on 'q' key
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+
+    elapsed = time.perf_counter() - start
+    source.stop()
+    if not args.headless:
+        cv2.destroyAllWindows()
+
+    return {
+        "source": str(args.source),
+        "backend": backend.name,
+        "detect_every": args.detect_every,
+        "frames": frames,
+        "dropped": source.dropped,
+        "seconds": round(elapsed, 3),
+        "fps": round(frames / elapsed, 1) if elapsed > 0 else 0.0,
+        "detector_runs": detections,
+        "tracks": tracker.next_id - 1,
+        "tracks_lost": tracker.lost,
+        "gender_inferences": inferences,
+        "detect_ms_mean": round(stage_ms["detect"] / max(detections, 1), 3),
+        "track_ms_mean": round(stage_ms["track"] / max(frames - detections, 1), 3),
+        "gender_wait_ms_mean": round(stage_ms["gender"] / max(frames, 1), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipelined real-time gender detection")
+    parser.add_argument("--source", default="0", help="Camera index or video file")
+    parser.add_argument("--detect-every", type=int, default=5, help="Run the face detector every N frames")
+    parser.add_argument("--backend", default="caffe", help="Gender backend (caffe, onnx, tflite)")
+    parser.add_argument("--model", help="Gender model path (default: the backend's file next to this script)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-frames", type=int, default=0, help="Stop after N frames (0 = whole source)")
+    parser.add_argument("--headless", action="store_true", help="No window; wait for every prediction")
+    parser.add_argument("--json", help="Write the run summary to this file")
+    args = parser.parse_args()
+    args.detect_every = max(1, args.detect_every)
+
+    result = run(args)
+    if result is None:
+        return
+
+    print(f"{result['frames']} frames in {result['seconds']}s: {result['fps']} FPS "
+          f"({result['dropped']} dropped), detector {result['detector_runs']}x @ {result['detect_ms_mean']} ms, "
+          f"tracker {result['track_ms_mean']} ms, {result['gender_inferences']} gender inferences "
+          f"for {result['tracks']} tracks")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
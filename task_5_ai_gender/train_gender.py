@@ -1,8 +1,5 @@
 import os
-import cv2
 import numpy as np
-from tqdm import tqdm
-from sklearn.model_selection import train_test_split
 import tensorflow as tf
 from tensorflow.keras.applications import MobileNetV2
 from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
@@ -16,56 +13,101 @@ IMG_SIZE = 128
 BATCH_SIZE = 32
 EPOCHS = 15        # training الأول
 FINE_TUNE_EPOCHS = 5
-
-# -----------------------------
-# LOAD DATA
-# -----------------------------
-images = []
-labels = []
-
-print("Loading dataset...")
-
-for file in tqdm(os.listdir(DATASET_PATH)):
-    if file.endswith(".jpg"):
-        try:
-            parts = file.split("_")
-            if len(parts) < 2:
-                continue
-
-            gender = int(parts[1])   # 0 = male, 1 = female
-            if gender not in [0, 1]:
-                continue
-
-            img_path = os.path.join(DATASET_PATH, file)
-            img = cv2.imread(img_path)
-            if img is None:
-                continue
-
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            img = cv2.resize(img, (IMG_SIZE, IMG_SIZE))
-            img = img / 255.0
-
-            images.append(img)
-            labels.append(gender)
-
-        except:
-            continue
-
-X = np.array(images, dtype=np.float32)
-y = np.array(labels, dtype=np.int32)
-
-print("Total samples:", len(X))
-print("Label distribution:", np.unique(y, return_counts=True))
-
-# -----------------------------
-# SPLIT DATA
-# -----------------------------
-X_train, X_val, y_train, y_val = train_test_split(
-    X, y,
-    test_size=0.2,
-    random_state=42,
-    stratify=y
-)
+CACHE_DIR = None   # e.g. "/tmp/utkface_cache" to keep decoded images on disk between epochs/runs
+SHARDS_DIR = None  # e.g. "shards/utkface" from gender_shards.py; skips JPEG decoding entirely
+SHARDS_FOLD = "utkface"
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+def normalize(img, label):
+    img = tf.cast(img, tf.float32)
+    if img.shape[1] != IMG_SIZE:
+        img = tf.image.resize(img, (IMG_SIZE, IMG_SIZE))
+    return img / 255.0, label
+
+
+if SHARDS_DIR:
+    # -----------------------------
+    # PREPROCESSED SHARDS (memory-mapped uint8)
+    # -----------------------------
+    from gender_shards import GenderShards
+
+    shards = GenderShards(SHARDS_DIR)
+    rows_train = shards.split(SHARDS_FOLD, "train")
+    rows_val = shards.split(SHARDS_FOLD, "val")
+    print(f"Shards: {len(rows_train)} train / {len(rows_val)} val ({shards.img_size}px)")
+
+    def make_shard_dataset(rows, training):
+        def batches():
+            # New permutation every epoch when training
+            for images, batch_labels in shards.batches(rows, BATCH_SIZE, shuffle=training):
+                yield images[..., ::-1], batch_labels  # BGR -> RGB
+
+        size = shards.img_size
+        ds = tf.data.Dataset.from_generator(batches, output_signature=(
+            tf.TensorSpec((None, size, size, 3), tf.uint8),
+            tf.TensorSpec((None,), tf.int32),
+        ))
+        ds = ds.map(normalize, num_parallel_calls=AUTOTUNE)
+        return ds.prefetch(AUTOTUNE)
+
+    train_ds = make_shard_dataset(rows_train, training=True)
+    val_ds = make_shard_dataset(rows_val, training=False)
+
+else:
+    # -----------------------------
+    # LIST DATA
+    # -----------------------------
+    # UTKFace names: <age>_<gender>_<race>_<date>.jpg, gender 0 = male, 1 = female
+    from gender_shards import stratified_split, utkface_files
+
+    print("Listing dataset...")
+
+    paths, labels = utkface_files(DATASET_PATH)
+    paths = np.array(paths)
+    labels = labels.astype(np.int32)
+
+    print("Total samples:", len(paths))
+    print("Label distribution:", np.unique(labels, return_counts=True))
+
+    # -----------------------------
+    # SPLIT DATA (paths only, nothing decoded yet)
+    # -----------------------------
+    # Same split as `gender_shards.py utkface` with its defaults, so both paths validate on the same images
+    idx_train, idx_val = stratified_split(labels, val_split=0.2, seed=42)
+    paths_train, y_train = paths[idx_train], labels[idx_train]
+    paths_val, y_val = paths[idx_val], labels[idx_val]
+
+    # -----------------------------
+    # INPUT PIPELINE
+    # -----------------------------
+    def load_image(path, label):
+        """Decode and resize one image; kept as uint8 so the optional cache stays small."""
+        img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        img = tf.image.resize(img, (IMG_SIZE, IMG_SIZE))
+        return tf.cast(tf.round(img), tf.uint8), label
+
+    def make_dataset(paths, labels, training, cache_name):
+        ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+        if training and not CACHE_DIR:
+            # Shuffle (path, label) pairs: the whole list fits in a few MB, decoded images would not
+            ds = ds.shuffle(len(paths), seed=42, reshuffle_each_iteration=True)
+        ds = ds.map(load_image, num_parallel_calls=AUTOTUNE)
+        # Skip unreadable or corrupt files instead of failing mid-epoch
+        ds = ds.ignore_errors()
+        if CACHE_DIR:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # The cache holds resized images, so its name carries the size
+            ds = ds.cache(os.path.join(CACHE_DIR, f"{cache_name}_{IMG_SIZE}"))
+            if training:
+                # After the cache, or every epoch would replay the first epoch's order
+                ds = ds.shuffle(min(len(paths), 10000), seed=42, reshuffle_each_iteration=True)
+        ds = ds.batch(BATCH_SIZE)
+        ds = ds.map(normalize, num_parallel_calls=AUTOTUNE)
+        return ds.prefetch(AUTOTUNE)
+
+    train_ds = make_dataset(paths_train, y_train, training=True, cache_name="train")
+    val_ds = make_dataset(paths_val, y_val, training=False, cache_name="val")
 
 # -----------------------------
 # BUILD MODEL
@@ -98,10 +140,9 @@ model.summary()
 # -----------------------------
 print("\nStarting initial training...")
 history = model.fit(
-    X_train, y_train,
-    validation_data=(X_val, y_val),
-    epochs=EPOCHS,
-    batch_size=BATCH_SIZE
+    train_ds,
+    validation_data=val_ds,
+    epochs=EPOCHS
 )
 
 # -----------------------------
@@ -122,10 +163,9 @@ model.compile(
 )
 
 history_finetune = model.fit(
-    X_train, y_train,
-    validation_data=(X_val, y_val),
-    epochs=FINE_TUNE_EPOCHS,
-    batch_size=BATCH_SIZE
+    train_ds,
+    validation_data=val_ds,
+    epochs=FINE_TUNE_EPOCHS
 )
 
 # -----------------------------